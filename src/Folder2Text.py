@@ -1,14 +1,17 @@
-﻿import os
+import os
 import sys
-import shutil
-import locale
-import argparse
-import logging
-import tempfile
-from logging.handlers import TimedRotatingFileHandler
-from datetime import datetime
-from pathlib import Path
-from typing import Iterable, List, Set, Optional
+
+# Entry point, kept small on purpose: every context-menu click is a cold
+# start, and a script run as __main__ is compiled on every start (it is
+# never cached as bytecode). When a resident --serve process is running,
+# the request is handed to it with nothing but os, json and
+# multiprocessing.connection loaded. Otherwise the arguments are parsed
+# here, and the pipeline (folder2text_core, cached as bytecode like any
+# imported module) is loaded only after that: --help and usage errors never
+# load it.
+#
+# Library use: "from Folder2Text import merge, MergeOptions" keeps working,
+# names not defined here are looked up in folder2text_core on first use.
 
 # =========================
 # Metadati applicazione
@@ -23,62 +26,26 @@ COPYRIGHT = "Copyright (c) 2026 Folder2Text. All rights reserved."
 # =========================
 
 DEFAULT_MAX_FILE_SIZE_MB = 10
-TEXT_DETECTION_THRESHOLD = 0.85
-BINARY_SAMPLE_SIZE = 8192
-LOG_RETENTION_DAYS = 30  # Keep logs for 30 days, then auto-delete
-DEV_MODE = False  # Set to True for detailed file processing logs
-
-EXIT_OK = 0
-EXIT_NO_ARGUMENTS = 1
-EXIT_NO_FILES = 2
-EXIT_RUNTIME_ERROR = 3
-
-EXCLUDED_DIRECTORIES: Set[str] = {
-    ".git",
-    ".svn",
-    ".hg",
-    "node_modules",
-    "__pycache__",
-    ".venv",
-    "venv",
-    "env",
-    "dist",
-    "build",
-    "out",
-}
-
-SUPPORTED_EXTENSIONS: Set[str] = {
-    ".txt", ".log", ".md", ".rst", ".adoc", ".asciidoc",
-    ".xml", ".xsd", ".xsl", ".xslt", ".html", ".htm", ".svg",
-    ".json", ".jsonc", ".json5", ".yaml", ".yml", ".csv", ".tsv",
-    ".properties", ".ini", ".cfg", ".conf", ".toml",
-    ".py", ".pyw",
-    ".js", ".mjs", ".cjs", ".ts", ".tsx", ".jsx",
-    ".java", ".c", ".h", ".cpp", ".hpp",
-    ".cs", ".go", ".rs", ".kt", ".kts",
-    ".swift", ".dart", ".php", ".rb",
-    ".scala", ".groovy",
-    ".sh", ".bash", ".bat", ".cmd", ".ps1",
-    ".sql",
-    ".tex", ".latex", ".bib",
-    ".diff", ".patch",
-    ".rtf",
-}
-
-SUPPORTED_FILENAMES: Set[str] = {
-    "dockerfile",
-    ".env",
-    ".env.example",
-    ".gitignore",
-    ".gitattributes",
-    "pom.xml",
-    "gradle.build",
-}
-
-LABELS = {
-    "en": "Merged text export created",
-    "it": "Export di testo unificato creato",
-}
+DEFAULT_WORKERS = 1  # 1 = serial processing (no thread pool)
+DEFAULT_PDF_WORKERS = min(4, os.cpu_count() or 1)  # 0 = extract PDFs in-process
+DEFAULT_PDF_TIME_CAP_SECONDS = 120  # Per-document extraction cap (0 = no cap)
+DEFAULT_CACHE_SIZE_MB = 256  # Extraction cache on disk, least recently used evicted
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}  # --compress
+BUDGET_POLICIES = ("skip", "stop")  # --budget-policy, see folder2text_core.TokenBudget
+SERVER_FILE_NAME = "server.json"  # --serve: address and key, in the app data directory
+SERVER_ACCEPT_TIMEOUT_SECONDS = 5.0  # Client: a server that does not take the request in time is ignored
+SERVER_REPLY_TIMEOUT_SECONDS = 30 * 60.0  # Client: longest wait for a forwarded export to finish
+
+# Why the resident server was not used, logged once logging is configured
+SERVER_FALLBACK_REASONS: list[str] = []
+
+def app_data_location() -> str:
+    """%LOCALAPPDATA%\\Folder2Text, or the temp directory where it is not set."""
+    base = os.environ.get("LOCALAPPDATA")
+    if base is None:
+        import tempfile
+        base = tempfile.gettempdir()
+    return os.path.join(base, APP_NAME)
 
 # =========================
 # BOOTSTRAP LOGGING (CRITICO)
@@ -89,7 +56,12 @@ def bootstrap_logging() -> None:
     Inizializza il logging MINIMALE prima di qualunque altra operazione.
     Deve funzionare anche se argparse o altre parti falliscono.
     BRUTE FORCE: Log to TEMP directory with immediate flush.
+    Runs right after argument parsing (see run_in_process()).
     """
+    import logging
+    import tempfile
+    from datetime import datetime
+    from pathlib import Path
     try:
         # Use TEMP directory for guaranteed write access
         temp_dir = Path(tempfile.gettempdir())
@@ -128,234 +100,115 @@ def bootstrap_logging() -> None:
         except:
             pass  # Ultima difesa: il logging non deve MAI impedire l'avvio
 
-bootstrap_logging()
-
 # =========================
-# Utility lingua
+# Client del server residente (--serve)
 # =========================
 
-def detect_language() -> str:
-    """Rileva la lingua per i messaggi utente."""
+def forward_to_server(argv: list[str]) -> int | None:
+    """
+    Thin client: hand argv to a running --serve process and return its exit
+    code. None means "run in-process": no server, or a request the server
+    leaves to the client (errors to show, --watch).
+
+    Every wait is bounded: a server that does not answer the handshake or
+    acknowledge the request within SERVER_ACCEPT_TIMEOUT_SECONDS (hung,
+    stopped in a debugger, a stale pid reusing the socket), or that does
+    not finish within SERVER_REPLY_TIMEOUT_SECONDS, is dropped and the
+    export runs in-process.
+    """
+    if not argv or any(argument in ("--serve", "--watch", "--profile") for argument in argv):
+        return None
     try:
-        locale_code, _ = locale.getlocale()
-        if not locale_code:
-            return "en"
-        return locale_code.split("_", 1)[0].lower()
-    except Exception:
-        return "en"
-
-LANG = detect_language()
-FINAL_MESSAGE = LABELS.get(LANG, LABELS["en"])
-
-# =========================
-# Logging completo (override)
-# =========================
-
-def configure_logging(verbose: bool) -> None:
-    """Configura logging completo con rotazione giornaliera."""
-    log_dir = Path(os.environ.get("LOCALAPPDATA", tempfile.gettempdir())) / APP_NAME / "logs"
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = log_dir / "debug.log"
-
-    log_level = logging.DEBUG if verbose else logging.INFO
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-
-    file_handler = TimedRotatingFileHandler(
-        log_file,
-        when="D",
-        interval=1,
-        backupCount=LOG_RETENTION_DAYS,
-        encoding="utf-8",
-    )
-    file_handler.setFormatter(formatter)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-
-    root_logger = logging.getLogger()
-    root_logger.handlers.clear()
-    root_logger.setLevel(log_level)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
-
-    logging.debug("Full logging configured at: %s", log_file)
-
-# =========================
-# Utility file system
-# =========================
-
-def sanitize_argument(argument: str) -> str:
-    if not argument:
-        return ""
-    cleaned = argument.strip().strip('"').strip("'")
-    if cleaned.startswith(">"):
-        cleaned = cleaned[1:]
-    return cleaned.strip()
-
-def is_supported_file(path: Path) -> bool:
-    # Exclude previous output files generated by this app
-    if path.name.startswith("output-") and path.suffix.lower() == ".txt":
-        return False
-
-    return (
-        path.name.lower() in SUPPORTED_FILENAMES
-        or path.suffix.lower() in SUPPORTED_EXTENSIONS
-    )
-
-def is_probably_text_file(path: Path) -> bool:
+        with open(os.path.join(app_data_location(), SERVER_FILE_NAME), encoding="utf-8") as info_file:
+            info_text = info_file.read()
+    except OSError:
+        return None  # No server
     try:
-        with open(path, "rb") as file:
-            sample = file.read(BINARY_SAMPLE_SIZE)
-            if not sample:
-                return True
-            printable = sum(
-                byte in (9, 10, 13) or 32 <= byte <= 126
-                for byte in sample
-            )
-            ratio = printable / len(sample)
-            return ratio >= TEXT_DETECTION_THRESHOLD
-    except Exception:
-        return False
-
-def read_text_safely(path: Path) -> Optional[str]:
-    for encoding in ("utf-8", "utf-8-sig", "utf-16", "cp1252", "latin-1"):
-        try:
-            with open(path, "r", encoding=encoding) as file:
-                return file.read()
-        except Exception:
-            continue
-    return None
+        import json
+        info = json.loads(info_text)
+        with _connect_to_server(info) as connection:
+            connection.send({"argv": argv, "cwd": os.getcwd()})
+            _receive_from_server(connection, SERVER_ACCEPT_TIMEOUT_SECONDS)  # {"accepted": True}
+            reply = _receive_from_server(connection, SERVER_REPLY_TIMEOUT_SECONDS)
+    except Exception as error:  # Stale server file, server gone or hung mid-request...
+        SERVER_FALLBACK_REASONS.append(f"{type(error).__name__}: {error}")
+        return None
+    return reply.get("exit_code")
 
-def extract_pdf_text(path: Path) -> Optional[str]:
+def _connect_to_server(info: dict):
     """
-    Extract text from PDF file.
-    Returns None if extraction fails or PDF is image-only.
+    multiprocessing.connection.Client() without its unbounded wait: the
+    server's authentication challenge is polled for before answering it.
     """
+    from multiprocessing import connection as mp_connection
+    if info["family"] == "AF_PIPE":
+        connection = mp_connection.PipeClient(info["address"])
+    else:
+        connection = mp_connection.SocketClient(info["address"])
     try:
-        import PyPDF2
-        with open(path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-
-            # Check if PDF has pages
-            if len(reader.pages) == 0:
-                return None
-
-            # Extract text from all pages
-            text_parts = []
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_parts.append(page_text)
-
-            full_text = '\n\n'.join(text_parts)
-
-            # Return None if no text extracted (image-only PDF)
-            if not full_text.strip():
-                return None
+        authkey = bytes.fromhex(info["authkey"])
+        if not connection.poll(SERVER_ACCEPT_TIMEOUT_SECONDS):
+            raise TimeoutError(f"no handshake within {SERVER_ACCEPT_TIMEOUT_SECONDS:g} s")
+        mp_connection.answer_challenge(connection, authkey)
+        mp_connection.deliver_challenge(connection, authkey)
+    except BaseException:
+        connection.close()
+        raise
+    return connection
 
-            return full_text
+def _receive_from_server(connection, timeout: float) -> dict:
+    if not connection.poll(timeout):
+        raise TimeoutError(f"no reply within {timeout:g} s")
+    return connection.recv()
 
-    except ImportError:
-        logging.warning("PyPDF2 not installed - PDF support disabled")
-        return None
-    except Exception as e:
-        logging.debug(f"PDF extraction failed: {e}")
-        return None
+# =========================
+# Riga di comando
+# =========================
 
-def validate_selection(arguments: Iterable[str]) -> tuple[bool, str]:
+def parse_token_count(text: str) -> int:
+    """ "128000", "128k", "1.5M" -> tokens (k/M = 1000-based, like model context sizes)."""
+    import argparse
+    import re
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)\s*(?:tok|tokens?)?\s*", text.lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid token count {text!r} (examples: 128000, 128k, 1M)")
+    number, multiplier = match.groups()
+    tokens = int(float(number) * {"": 1, "k": 1000, "m": 1000**2, "g": 1000**3}[multiplier])
+    if tokens <= 0:
+        raise argparse.ArgumentTypeError("the token budget must be positive")
+    return tokens
+
+def parse_shard_size(text: str) -> tuple[int, str]:
     """
-    Validate user selection according to context menu rules.
-    Returns (is_valid, error_message).
-
-    Rules:
-    1. Single file: Must be supported extension
-    2. Multi-selection with folders: Always valid
-    3. Multi-selection files only: At least one must be supported
+    "25MB", "500k", "1048576" (bytes) or "100k-tokens", "128000tok"
+    (estimated tokens) -> (limit, "bytes" | "tokens").
     """
-    paths = []
-    for argument in arguments:
-        sanitized = sanitize_argument(argument)
-        if sanitized:
-            path = Path(sanitized).expanduser().resolve()
-            if path.exists():
-                paths.append(path)
-
-    if not paths:
-        return False, "No valid paths provided."
-
-    # Check if any path is a directory
-    has_directory = any(p.is_dir() for p in paths)
-
-    # CASE 2: Multi-selection with at least one folder -> Always valid
-    if has_directory:
-        return True, ""
-
-    # Get only files
-    files = [p for p in paths if p.is_file()]
-
-    if not files:
-        return False, "No valid files in selection."
-
-    # CASE 1: Single file
-    if len(files) == 1:
-        if is_supported_file(files[0]):
-            return True, ""
-        else:
-            ext = files[0].suffix.lower() or "(no extension)"
-            return False, f"File type '{ext}' is not supported.\n\nSupported types include: .txt, .py, .java, .js, .md, .json, .pdf, and 60+ more.\n\nSee documentation for full list."
-
-    # CASE 3: Multi-selection files only
-    # At least one must be supported
-    supported_files = [f for f in files if is_supported_file(f)]
-
-    if supported_files:
-        return True, ""
+    import argparse
+    import re
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)\s*-?\s*(b|tok|tokens?)?\s*", text.lower())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid size {text!r} (examples: 25MB, 500k, 100k-tokens)")
+    number, multiplier, unit = match.groups()
+    limit = int(float(number) * {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}[multiplier])
+    if unit and unit.startswith("tok"):
+        limit = int(float(number) * {"": 1, "k": 1000, "m": 1000**2, "g": 1000**3}[multiplier])
+        unit = "tokens"
     else:
-        # Show first few unsupported extensions
-        unsupported_exts = list(set(f.suffix.lower() for f in files[:5]))
-        ext_list = ", ".join(unsupported_exts)
-        return False, f"None of the selected files are supported.\n\nUnsupported types: {ext_list}\n\nSupported types include: .txt, .py, .java, .js, .md, .json, .pdf, and 60+ more."
-
-def expand_input_paths(arguments: Iterable[str]) -> List[Path]:
-    collected_files: Set[Path] = set()
-
-    for argument in arguments:
-        sanitized = sanitize_argument(argument)
-        if not sanitized:
-            continue
-
-        path = Path(sanitized).expanduser().resolve()
-
-        if not path.exists():
-            logging.debug("Path not found: %s", path)
-            continue
-
-        if path.is_file():
-            collected_files.add(path)
-            continue
-
-        if path.is_dir():
-            for root, directories, filenames in os.walk(path):
-                directories[:] = [
-                    directory
-                    for directory in directories
-                    if directory not in EXCLUDED_DIRECTORIES
-                ]
-                for filename in filenames:
-                    collected_files.add(Path(root) / filename)
+        unit = "bytes"
+    if limit <= 0:
+        raise argparse.ArgumentTypeError("the shard size must be positive")
+    return limit, unit
 
-    return sorted(collected_files)
+def parse_arguments(argv: list[str] | None = None):
+    """argv (default: sys.argv[1:]) -> argparse.Namespace; exits on usage errors."""
+    import argparse
+    from pathlib import Path
 
-# =========================
-# Main logic
-# =========================
-
-def main() -> None:
     parser = argparse.ArgumentParser(
         prog=APP_NAME,
         description="Merge multiple text files into a single output file",
     )
-    parser.add_argument("paths", nargs="+", help="Input files or directories")
+    parser.add_argument("paths", nargs="*", help="Input files or directories")
     parser.add_argument("-o", "--output", type=Path, help="Output file path")
     parser.add_argument(
         "--max-size-mb",
@@ -363,6 +216,118 @@ def main() -> None:
         default=DEFAULT_MAX_FILE_SIZE_MB,
         help="Maximum file size in MB",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Threads used to read and decode files (output order is unchanged)",
+    )
+    parser.add_argument(
+        "--walk-workers",
+        type=int,
+        help="Threads listing directories in parallel, e.g. on network shares (default: same as --workers)",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Only merge files matching this gitignore-style glob (repeatable)",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Skip files and folders matching this gitignore-style glob (repeatable)",
+    )
+    parser.add_argument(
+        "--no-ignore",
+        action="store_true",
+        help="Do not read .gitignore/.ignore files",
+    )
+    parser.add_argument(
+        "--pdf-workers",
+        type=int,
+        default=DEFAULT_PDF_WORKERS,
+        help="Processes used for PDF text extraction (0 = extract in-process)",
+    )
+    parser.add_argument(
+        "--pdf-time-cap",
+        type=float,
+        default=DEFAULT_PDF_TIME_CAP_SECONDS,
+        help="Seconds allowed per PDF document before it is skipped (0 = no cap)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the extraction cache",
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=int,
+        default=DEFAULT_CACHE_SIZE_MB,
+        help="Size limit of the extraction cache in MB",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse unchanged sections of the previous output (tracked in a manifest next to it)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and refresh the output whenever the selected files change (Ctrl+C to stop)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Stay resident and run exports forwarded by later invocations (faster startup)",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        help="Compress the output while it is written (.gz/.xz/.zst is appended; zstd needs the zstandard module)",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=parse_shard_size,
+        metavar="SIZE",
+        help="Split the output into .partNN files of at most SIZE, e.g. 25MB or 100k-tokens (on file boundaries)",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=parse_token_count,
+        metavar="N",
+        help="Stop adding files once their estimated tokens would exceed N, e.g. 128k (summary not counted)",
+    )
+    parser.add_argument(
+        "--budget-policy",
+        choices=BUDGET_POLICIES,
+        default="skip",
+        help="Over the token budget: skip files that do not fit and keep filling with smaller ones, or stop at the first",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Merge identical files (copies, hard links, symlinks) once and reference the first afterwards; hashes every file sharing its size with another",
+    )
+    parser.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Read large files in chunks instead of memory-mapping them (for inputs that may be truncated meanwhile)",
+    )
+    parser.add_argument(
+        "--stats-json",
+        type=Path,
+        metavar="PATH",
+        help="Write timings per phase, bytes read/written, exclusion reasons and the slowest files as JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the export (cProfile + tracemalloc); dumps are written next to the log folder",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -371,258 +336,60 @@ def main() -> None:
         help="Enable verbose logging",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if not args.paths and not args.serve:
+        parser.error("the following arguments are required: paths")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.walk_workers is None:
+        args.walk_workers = args.workers
+    if args.walk_workers < 1:
+        parser.error("--walk-workers must be at least 1")
+    if args.pdf_workers < 0:
+        parser.error("--pdf-workers cannot be negative")
+    if args.cache_size_mb < 0:
+        parser.error("--cache-size-mb cannot be negative")
+    if args.shard_size is not None and (args.incremental or args.watch):
+        parser.error("--shard-size cannot be combined with --incremental or --watch")
+    if args.compress is not None:
+        if args.incremental or args.watch:
+            parser.error("--compress cannot be combined with --incremental or --watch")
+        if args.compress == "zstd":
+            import importlib.util
+            if importlib.util.find_spec("zstandard") is None:
+                parser.error("--compress zstd requires the zstandard module (pip install zstandard)")
+    return args
 
-    configure_logging(args.verbose)
-    logging.debug("Arguments received: %s", args.paths)
-
-    # Validate selection before processing
-    is_valid, error_message = validate_selection(args.paths)
-    if not is_valid:
-        logging.warning("Invalid selection: %s", error_message)
-        # Show user-friendly error dialog (windowed mode)
-        try:
-            import tkinter as tk
-            from tkinter import messagebox
-            root = tk.Tk()
-            root.withdraw()  # Hide main window
-            messagebox.showerror(
-                f"{APP_NAME} - Invalid Selection",
-                error_message
-            )
-            root.destroy()
-        except Exception:
-            # Fallback to console error
-            print(f"\nERROR: {error_message}")
-        sys.exit(EXIT_NO_FILES)
-
-    selected_files = expand_input_paths(args.paths)
-
-    if not selected_files:
-        logging.error("No valid text files found in provided paths")
-        logging.debug("Searched paths: %s", args.paths)
-        logging.debug("Total paths provided: %d", len(args.paths))
-        print(f"\nERROR: No valid text files found in the specified location(s).")
-        print(f"Searched: {', '.join(str(p) for p in args.paths)}")
-        sys.exit(EXIT_NO_FILES)
-
-    # Determine base directory for relative paths (where files are located)
-    if len(selected_files) > 1:
-        base_directory = Path(os.path.commonpath(selected_files))
-    else:
-        base_directory = selected_files[0].parent
+# =========================
+# API di libreria (folder2text_core)
+# =========================
 
-    # Determine output directory: always use parent of base_directory
-    # This ensures output is created one level up from where user clicked
-    if args.output:
-        output_file = args.output.resolve()
-        output_directory = output_file.parent
-    else:
-        # Get the first argument path (what user clicked on)
-        first_arg_path = Path(args.paths[0]).resolve()
-
-        # If user clicked on a directory, use its parent for output
-        # If user clicked on a file, use its parent's parent for output
-        if first_arg_path.is_dir():
-            output_directory = first_arg_path.parent
-            folder_name = first_arg_path.name
-        else:
-            output_directory = first_arg_path.parent.parent
-            folder_name = first_arg_path.parent.name
-
-        output_file = output_directory / f"output-{folder_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
-
-    logging.debug("Output will be created in: %s", output_directory)
-    logging.debug("Output file: %s", output_file)
-
-    max_size_bytes = args.max_size_mb * 1024 * 1024
-
-    # Track files for summary
-    included_files: List[Path] = []
-    excluded_files: List[tuple[Path, str]] = []  # (path, reason)
-
-    with tempfile.NamedTemporaryFile(
-        mode="w",
-        encoding="utf-8",
-        delete=False,
-        suffix=".tmp",
-    ) as temporary_file:
-        temporary_path = Path(temporary_file.name)
-
-        for file_path in selected_files:
-            try:
-                relative_name = (
-                    str(file_path.relative_to(base_directory))
-                    if file_path.is_relative_to(base_directory)
-                    else file_path.name
-                )
-
-                if not is_supported_file(file_path):
-                    # Always log when skipping output-*.txt files (important for user visibility)
-                    if file_path.name.startswith("output-") and file_path.suffix.lower() == ".txt":
-                        logging.info("Skipped previous output file: %s", relative_name)
-                        excluded_files.append((file_path, "Previous output file"))
-                    else:
-                        excluded_files.append((file_path, "Unsupported file type"))
-                        if DEV_MODE:
-                            logging.debug("Skipped unsupported file: %s", relative_name)
-                    continue
-
-                if file_path.stat().st_size > max_size_bytes:
-                    excluded_files.append((file_path, f"File too large (>{args.max_size_mb}MB)"))
-                    if DEV_MODE:
-                        logging.debug("Skipped oversized file: %s", relative_name)
-                    continue
-
-                # Special handling for PDF files (skip binary detection)
-                if file_path.suffix.lower() == '.pdf':
-                    content = extract_pdf_text(file_path)
-                    if content is None:
-                        excluded_files.append((file_path, "PDF text extraction failed (image-only or encrypted)"))
-                        if DEV_MODE:
-                            logging.debug("PDF unreadable: %s", relative_name)
-                        continue
-                else:
-                    # Standard text file handling
-                    if not is_probably_text_file(file_path):
-                        excluded_files.append((file_path, "Binary file detected"))
-                        if DEV_MODE:
-                            logging.debug("Skipped binary-like file: %s", relative_name)
-                        continue
-
-                    content = read_text_safely(file_path)
-                    if content is None:
-                        excluded_files.append((file_path, "Encoding not supported"))
-                        if DEV_MODE:
-                            logging.debug("Unreadable file: %s", relative_name)
-                        continue
-
-                temporary_file.write(f"\n=== {relative_name} ===\n")
-                temporary_file.write(content.rstrip())
-                temporary_file.write("\n")
-
-                included_files.append(file_path)
-
-                if DEV_MODE:
-                    logging.debug("Merged file: %s", relative_name)
-
-            except Exception as exception:
-                excluded_files.append((file_path, f"Error: {exception}"))
-                logging.error(
-                    "Error processing file %s: %s",
-                    file_path,
-                    exception,
-                    exc_info=True,
-                )
-
-        # Write summary at end of file
-        temporary_file.write("\n\n")
-        temporary_file.write("="*80 + "\n")
-        temporary_file.write("EXTRACTION SUMMARY\n")
-        temporary_file.write("="*80 + "\n\n")
-
-        # Application info
-        temporary_file.write(f"Generated by: {APP_NAME} v{VERSION}\n")
-        temporary_file.write(f"{COPYRIGHT}\n")
-        temporary_file.write(f"Extraction date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        temporary_file.write(f"Base directory: {base_directory}\n")
-        temporary_file.write(f"Output file: {output_file}\n")
-        temporary_file.write("\n")
-
-        # Statistics
-        total_files = len(selected_files)
-        total_included = len(included_files)
-        total_excluded = len(excluded_files)
-
-        temporary_file.write(f"Files scanned: {total_files}\n")
-        temporary_file.write(f"Files included: {total_included}\n")
-        temporary_file.write(f"Files excluded: {total_excluded}\n")
-        temporary_file.write(f"Verification: {total_included} + {total_excluded} = {total_included + total_excluded} ")
-
-        if total_included + total_excluded == total_files:
-            temporary_file.write("✓ OK\n")
-        else:
-            temporary_file.write(f"✗ MISMATCH (expected {total_files})\n")
-
-        temporary_file.write("\n")
-
-        # Included files with absolute paths
-        if included_files:
-            temporary_file.write(f"\n--- INCLUDED FILES ({total_included}) ---\n\n")
-            for idx, file_path in enumerate(included_files, 1):
-                temporary_file.write(f"{idx:4}. {file_path}\n")
-
-        # Excluded files with reasons
-        if excluded_files:
-            temporary_file.write(f"\n--- EXCLUDED FILES ({total_excluded}) ---\n\n")
-            for idx, (file_path, reason) in enumerate(excluded_files, 1):
-                temporary_file.write(f"{idx:4}. {file_path}\n")
-                temporary_file.write(f"      Reason: {reason}\n")
-
-        temporary_file.write("\n")
-        temporary_file.write("="*80 + "\n")
-        temporary_file.write("END OF EXTRACTION SUMMARY\n")
-        temporary_file.write("="*80 + "\n")
-
-    # Use shutil.move instead of os.replace to support cross-drive moves
-    shutil.move(temporary_path, output_file)
-
-    # Log completion with summary (no console output in windowed mode)
-    logging.info("Process completed successfully: %s", output_file)
-    logging.info("Total files scanned: %d", total_files)
-    logging.info("Files included: %d", total_included)
-    logging.info("Files excluded: %d", total_excluded)
-    logging.info("Output size: %.2f MB", output_file.stat().st_size / (1024*1024))
-    logging.info("Output location: %s", output_file.parent)
-
-    # Show Windows notification (with full error logging)
-    # Note: win10toast is optional and may have internal issues on some systems
+def __getattr__(name: str):
+    import folder2text_core
     try:
-        import warnings
-        with warnings.catch_warnings(record=True) as warning_list:
-            warnings.simplefilter("always")
-            from win10toast import ToastNotifier
-            toaster = ToastNotifier()
-            toaster.show_toast(
-                "Folder2Text",
-                f"Merged {total_included} files successfully!\n{output_file.name}",
-                duration=5,
-                threaded=False, # Non-threaded to capture all exceptions
-                icon_path=None  # Explicitly disable icon lookup to prevent PyInstaller crash
-            )
-
-            # Log any warnings from win10toast
-            if warning_list:
-                for warning_item in warning_list:
-                    logging.debug("win10toast warning: %s - %s",
-                                 warning_item.category.__name__,
-                                 warning_item.message)
-
-        logging.debug("Windows notification completed (may have shown)")
-    except ImportError as import_err:
-        logging.warning("win10toast library not available: %s", import_err)
-        logging.debug("Notification skipped - library missing (non-critical)")
-    except Exception as notify_err:
-        import traceback
-        logging.warning("Windows notification failed (non-critical): %s", notify_err)
-        logging.debug("Notification exception type: %s", type(notify_err).__name__)
-        logging.debug("Notification exception traceback:\n%s", traceback.format_exc())
-
-    # Exit silently (no console pause needed in windowed mode)
-    logging.debug("Application completed - exiting silently")
-    sys.exit(EXIT_OK)
+        return getattr(folder2text_core, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
 # =========================
 # Entry point
 # =========================
 
-if __name__ == "__main__":
+def run_in_process() -> None:
+    """Parse the arguments, then load the pipeline and run the command in this process."""
+    import logging
     try:
+        args = parse_arguments()
+        bootstrap_logging()
+
         logging.debug("MAIN ENTRY POINT: Starting application")
         logging.debug("Arguments received: %s", sys.argv)
         logging.debug("Python version: %s", sys.version)
         logging.debug("Platform: %s", sys.platform)
-        main()
+        for reason in SERVER_FALLBACK_REASONS:
+            logging.debug("Resident server not used: %s", reason)
+        from folder2text_core import main
+        main(args)
         logging.debug("MAIN COMPLETED: Application finished successfully")
     except SystemExit as sys_exit:
         exit_code = sys_exit.code if sys_exit.code is not None else 0
@@ -642,7 +409,9 @@ if __name__ == "__main__":
 
         # Also write to fallback log
         try:
-            fallback_log = Path(tempfile.gettempdir()) / "Folder2Text_CRASH.log"
+            import tempfile
+            from datetime import datetime
+            fallback_log = os.path.join(tempfile.gettempdir(), "Folder2Text_CRASH.log")
             with open(fallback_log, "w") as f:
                 f.write(f"CRASH REPORT - {datetime.now()}\n")
                 f.write(f"Exception: {type(fatal_exception).__name__}\n")
@@ -654,4 +423,18 @@ if __name__ == "__main__":
         except:
             pass
 
-        sys.exit(EXIT_RUNTIME_ERROR)
\ No newline at end of file
+if __name__ == "__main__":
+    # Required for the PDF process pool in the PyInstaller build
+    if getattr(sys, "frozen", False):
+        import multiprocessing
+        multiprocessing.freeze_support()
+
+    # folder2text_core imports this module by name: let it find this one
+    # instead of loading a second copy
+    sys.modules.setdefault(APP_NAME, sys.modules[__name__])
+
+    # A resident --serve process, if running, does the work
+    forwarded_exit_code = forward_to_server(sys.argv[1:])
+    if forwarded_exit_code is not None:
+        sys.exit(forwarded_exit_code)
+    run_in_process()
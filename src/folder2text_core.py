@@ -0,0 +1,4094 @@
+﻿import os
+import re
+import sys
+import io
+import codecs
+import argparse
+import logging
+import threading
+import math
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, closing, contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterable, Iterator, List, Sequence, Set, Optional, Union
+
+# Application metadata, command line and --serve client live in the entry point
+from Folder2Text import (
+    APP_NAME,
+    BUDGET_POLICIES,
+    COMPRESSION_SUFFIXES,
+    COPYRIGHT,
+    DEFAULT_CACHE_SIZE_MB,
+    DEFAULT_MAX_FILE_SIZE_MB,
+    DEFAULT_PDF_TIME_CAP_SECONDS,
+    DEFAULT_PDF_WORKERS,
+    DEFAULT_WORKERS,
+    SERVER_FILE_NAME,
+    VERSION,
+    app_data_location,
+    parse_arguments,
+)
+
+# Startup matters (every context-menu click is a cold start): modules only
+# some runs need (tempfile, shutil, sqlite3, json, multiprocessing,
+# concurrent.futures, logging.handlers, tkinter, PyPDF2, win10toast...)
+# are imported where they are used
+if TYPE_CHECKING:
+    import sqlite3
+    from concurrent.futures import ProcessPoolExecutor
+
+# =========================
+# Costanti tecniche
+# =========================
+
+TEXT_DETECTION_THRESHOLD = 0.85
+BINARY_SAMPLE_SIZE = 8192
+ENCODING_SNIFF_SIZE = 65536  # Prefix inspected by sniff_encoding()
+UTF16_NUL_RATIO = 0.7  # Share of NUL high bytes that marks BOM-less UTF-16
+STREAMING_THRESHOLD_BYTES = 8 * 1024 * 1024  # Larger files are copied in chunks
+STREAM_CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD_BYTES = 8 * 1024 * 1024  # Larger files are memory-mapped instead of read in chunks
+LOG_RETENTION_DAYS = 30  # Keep logs for 30 days, then auto-delete
+DEV_MODE = False  # Set to True for detailed file processing logs
+WORKER_QUEUE_DEPTH = 4  # Files in flight per worker in --workers mode
+PDF_PAGES_PER_TASK = 25  # Large PDFs are split into page ranges of this size
+IGNORE_FILE_NAMES = (".gitignore", ".ignore")  # Read in every scanned directory
+CACHE_SCHEMA_VERSION = 2  # 2: binary check samples head, middle and tail
+RACY_MTIME_WINDOW_NS = 2_000_000_000  # (size, mtime) of files modified this recently is not trusted
+MANIFEST_SUFFIX = ".manifest.json"  # --incremental: written next to the output
+MANIFEST_VERSION = 2  # 2: sections keep their token estimate
+WATCH_DEBOUNCE_SECONDS = 0.3  # --watch: quiet time before refreshing the output
+WATCH_POLL_INTERVAL_SECONDS = 1.0  # --watch without inotify
+STATS_SLOWEST_FILES = 20  # --stats-json: files listed by processing time
+SUMMARY_TOP_CONTRIBUTORS = 20  # Largest sections listed in the summary
+SUMMARY_TOP_GROUPS = 15  # Extensions / top-level folders listed in the summary
+PROFILE_TRACEMALLOC_FRAMES = 10  # --profile: stack depth kept per allocation
+COMPRESS_BLOCK_SIZE = 4 * 1024 * 1024  # gzip/xz: independently compressed blocks
+DEFAULT_COMPRESS_WORKERS = min(8, os.cpu_count() or 1)  # Threads compressing blocks
+DEFAULT_BYTES_PER_TOKEN = 4.0  # Token estimate for extensions not in TOKEN_BYTES_PER_EXTENSION
+NON_ASCII_BYTES_PER_TOKEN = 2.5  # UTF-8 beyond ASCII tokenizes much more densely
+DEDUPE_MIN_BYTES = 128  # Smaller identical files are merged again: a reference would not be shorter
+
+EXIT_OK = 0
+EXIT_NO_ARGUMENTS = 1
+EXIT_NO_FILES = 2
+EXIT_RUNTIME_ERROR = 3
+
+EXCLUDED_DIRECTORIES: Set[str] = {
+    ".git",
+    ".svn",
+    ".hg",
+    "node_modules",
+    "__pycache__",
+    ".venv",
+    "venv",
+    "env",
+    "dist",
+    "build",
+    "out",
+}
+
+SUPPORTED_EXTENSIONS: Set[str] = {
+    ".txt", ".log", ".md", ".rst", ".adoc", ".asciidoc",
+    ".xml", ".xsd", ".xsl", ".xslt", ".html", ".htm", ".svg",
+    ".json", ".jsonc", ".json5", ".yaml", ".yml", ".csv", ".tsv",
+    ".properties", ".ini", ".cfg", ".conf", ".toml",
+    ".py", ".pyw",
+    ".js", ".mjs", ".cjs", ".ts", ".tsx", ".jsx",
+    ".java", ".c", ".h", ".cpp", ".hpp",
+    ".cs", ".go", ".rs", ".kt", ".kts",
+    ".swift", ".dart", ".php", ".rb",
+    ".scala", ".groovy",
+    ".sh", ".bash", ".bat", ".cmd", ".ps1",
+    ".sql",
+    ".tex", ".latex", ".bib",
+    ".diff", ".patch",
+    ".rtf",
+    ".pdf",
+}
+
+SUPPORTED_FILENAMES: Set[str] = {
+    "dockerfile",
+    ".env",
+    ".env.example",
+    ".gitignore",
+    ".gitattributes",
+    "pom.xml",
+    "gradle.build",
+}
+
+# =========================
+# Logging completo (override)
+# =========================
+
+def app_data_directory() -> Path:
+    """%LOCALAPPDATA%\\Folder2Text, or the temp directory where it is not set."""
+    return Path(app_data_location())
+
+_LOG_LISTENER = None  # QueueListener writing log records to the handlers
+
+def configure_logging(verbose: bool) -> None:
+    """
+    Configura logging completo con rotazione giornaliera.
+    Callers only enqueue records: a QueueListener thread does the file
+    and console writes and flushes, off the processing threads.
+    """
+    global _LOG_LISTENER
+    import atexit
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+    log_dir = app_data_directory() / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_file = log_dir / "debug.log"
+
+    log_level = logging.DEBUG if verbose else logging.INFO
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+
+    file_handler = TimedRotatingFileHandler(
+        log_file,
+        when="D",
+        interval=1,
+        backupCount=LOG_RETENTION_DAYS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(formatter)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    stop_logging()
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _LOG_LISTENER = QueueListener(log_queue, file_handler, console_handler)
+    _LOG_LISTENER.start()
+    atexit.register(stop_logging)
+
+    root_logger = logging.getLogger()
+    root_logger.handlers.clear()
+    root_logger.setLevel(log_level)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    logging.debug("Full logging configured at: %s", log_file)
+
+def stop_logging() -> None:
+    """Write out the queued records and stop the listener thread."""
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        listener, _LOG_LISTENER = _LOG_LISTENER, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+class FileEvents:
+    """
+    Per-file log events (errors, PDF problems...), counted by kind.
+    Only the first event of each kind becomes a log record, unless
+    DEV_MODE is on, so a run over 100k files logs a handful of lines.
+    Each export counts its own (RunMetrics.events, passed down like
+    RunMetrics.io); FILE_EVENTS takes the events of calls outside one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def record(self, kind: str, level: int, message: str, *args, exc_info: bool = False) -> None:
+        with self._lock:
+            self.counts[kind] += 1
+            first = self.counts[kind] == 1
+        if first or DEV_MODE:
+            logging.log(level, message, *args, exc_info=exc_info)
+
+    def log_totals(self) -> None:
+        with self._lock:
+            counts = self.counts.copy()
+        for kind, count in counts.most_common():
+            logging.info("Per-file events: %d x %s", count, kind)
+
+FILE_EVENTS = FileEvents()
+
+# =========================
+# Utility file system
+# =========================
+
+def sanitize_argument(argument: str) -> str:
+    if not argument:
+        return ""
+    cleaned = argument.strip().strip('"').strip("'")
+    if cleaned.startswith(">"):
+        cleaned = cleaned[1:]
+    return cleaned.strip()
+
+def _name_suffix(name: str) -> str:
+    """Same result as Path(name).suffix, without building a Path."""
+    index = name.rfind(".")
+    return name[index:] if 0 < index < len(name) - 1 else ""
+
+def is_previous_output_name(name: str) -> bool:
+    if not name.startswith("output-"):
+        return False
+    lowered = name.lower()
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if lowered.endswith(".txt" + suffix):
+            return True
+    return _name_suffix(name).lower() == ".txt" or lowered.endswith(MANIFEST_SUFFIX)
+
+def is_supported_name(name: str) -> bool:
+    # Exclude previous output files generated by this app
+    if is_previous_output_name(name):
+        return False
+
+    return (
+        name.lower() in SUPPORTED_FILENAMES
+        or _name_suffix(name).lower() in SUPPORTED_EXTENSIONS
+    )
+
+def is_supported_file(path: Path) -> bool:
+    return is_supported_name(path.name)
+
+# Well-known binary signatures, checked against the first MAGIC_SNIFF_SIZE bytes
+BINARY_MAGIC_NUMBERS: tuple[tuple[bytes, str], ...] = (
+    (b"\x89PNG\r\n\x1a\n", "PNG image"),
+    (b"PK\x03\x04", "ZIP archive"),
+    (b"PK\x05\x06", "ZIP archive"),
+    (b"\x7fELF", "ELF executable"),
+    (b"SQLite format 3\x00", "SQLite database"),
+    (b"\xff\xd8\xff", "JPEG image"),
+    (b"GIF87a", "GIF image"),
+    (b"GIF89a", "GIF image"),
+    (b"\x1f\x8b", "gzip archive"),
+    (b"7z\xbc\xaf\x27\x1c", "7-Zip archive"),
+    (b"Rar!\x1a\x07", "RAR archive"),
+    (b"\xca\xfe\xba\xbe", "Java class / Mach-O"),
+)
+MAGIC_SNIFF_SIZE = 16
+
+# Bytes counted as printable by the ASCII test: TAB, LF, CR and 0x20-0x7E
+_ASCII_TEXT_BYTES = bytes([9, 10, 13]) + bytes(range(32, 127))
+_HIGH_BYTES = bytes(range(128, 256))
+# Characters counted as unprintable once UTF-16/32 samples are decoded
+_CONTROL_CHARACTERS = {
+    code: None
+    for code in (*range(32), 127, 0xFFFD)
+    if code not in (9, 10, 13)
+}
+
+def detect_binary_magic(sample: bytes) -> Optional[str]:
+    """Return the format name if the sample starts with a known binary signature."""
+    head = sample[:MAGIC_SNIFF_SIZE]
+    for signature, label in BINARY_MAGIC_NUMBERS:
+        if head.startswith(signature):
+            return label
+    # PE: "MZ" alone is too weak (text can start with it), so require the
+    # "PE\0\0" header that e_lfanew points to when it lies inside the sample
+    if head.startswith(b"MZ") and len(sample) >= 0x40:
+        pe_offset = int.from_bytes(sample[0x3C:0x40], "little")
+        if sample[pe_offset:pe_offset + 4] == b"PE\0\0":
+            return "PE executable"
+    return None
+
+def _is_utf8_prefix(sample: bytes) -> bool:
+    """True if sample is valid UTF-8, allowing a multi-byte sequence cut at the end."""
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def is_probably_text_sample(sample: bytes, encoding: Optional[str] = None) -> bool:
+    """
+    Classify a byte sample as text or binary without a per-byte Python loop.
+
+    Printable bytes are TAB/LF/CR and 0x20-0x7E; when the sample is valid
+    UTF-8, bytes >= 0x80 count as printable too, so accented and CJK sources
+    are not mistaken for binary. UTF-16/32 samples (see sniff_encoding) are
+    judged on their decoded characters. The text/binary cut-off is still
+    TEXT_DETECTION_THRESHOLD.
+    """
+    if not sample:
+        return True
+    if detect_binary_magic(sample) is not None:
+        return False
+
+    if encoding is not None and encoding.startswith(("utf-16", "utf-32")):
+        text = sample.decode(encoding, "replace")
+        if not text:
+            return True
+        printable = len(text.translate(_CONTROL_CHARACTERS))
+        return printable / len(text) >= TEXT_DETECTION_THRESHOLD
+
+    # translate(None, delete) runs in C: what survives is the unprintable bytes
+    non_text = sample.translate(None, _ASCII_TEXT_BYTES)
+    if non_text and _is_utf8_prefix(sample):
+        non_text = non_text.translate(None, _HIGH_BYTES)
+
+    printable = len(sample) - len(non_text)
+    ratio = printable / len(sample)
+    return ratio >= TEXT_DETECTION_THRESHOLD
+
+def _sample_encoding(encoding: str, head: bytes) -> str:
+    """Byte order of a BOM-marked UTF-16/32 file, for samples past the BOM."""
+    if encoding == "utf-32":
+        return "utf-32-le" if head.startswith(codecs.BOM_UTF32_LE) else "utf-32-be"
+    if encoding == "utf-16":
+        return "utf-16-le" if head.startswith(codecs.BOM_UTF16_LE) else "utf-16-be"
+    return encoding
+
+def sample_offsets(size: int) -> List[int]:
+    """Where the binary check samples a file: head, middle and tail (only the head if it fits)."""
+    if size <= BINARY_SAMPLE_SIZE:
+        return [0]
+    return [0, (size - BINARY_SAMPLE_SIZE) // 2, size - BINARY_SAMPLE_SIZE]
+
+def is_probably_text_content(
+    head: bytes,
+    read_at: Callable[[int, int], bytes],
+    size: int,
+    encoding: str,
+) -> bool:
+    """
+    is_probably_text_sample() on the head, middle and tail of a file of
+    size bytes; read_at(offset, length) returns bytes of the file. Whole
+    reads, chunked streams and mappings all go through here, so they agree
+    on every file (and on what the cache records). Samples past the head
+    start on a character boundary of encoding.
+    """
+    if not is_probably_text_sample(head[:BINARY_SAMPLE_SIZE], encoding):
+        return False
+    unit = 4 if encoding.startswith("utf-32") else 2 if encoding.startswith("utf-16") else 1
+    sample_encoding = _sample_encoding(encoding, head)
+    for start in sample_offsets(size)[1:]:
+        start -= start % unit
+        window = read_at(start, BINARY_SAMPLE_SIZE + 3)
+        skip = 0
+        if unit == 1:  # Skip the continuation bytes of a UTF-8 sequence
+            while skip < 3 and skip < len(window) and window[skip] & 0xC0 == 0x80:
+                skip += 1
+        if not is_probably_text_sample(window[skip:skip + BINARY_SAMPLE_SIZE], sample_encoding):
+            return False
+    return True
+
+def is_probably_text_file(path: Path) -> bool:
+    try:
+        with open(path, "rb") as file:
+            head = file.read(ENCODING_SNIFF_SIZE)
+
+            def read_at(offset: int, length: int) -> bytes:
+                file.seek(offset)
+                return file.read(length)
+
+            return is_probably_text_content(head, read_at, os.fstat(file.fileno()).st_size, sniff_encoding(head))
+    except Exception:
+        return False
+
+# =========================
+# Lettura file (single read)
+# =========================
+
+class IoCounters:
+    """Thread-safe counters for file opens, read calls, mappings and bytes read."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.reads = 0
+        self.mapped = 0  # Memory mappings (large-file detection and copies)
+        self.bytes_read = 0
+
+    def add(self, opens: int = 0, reads: int = 0, bytes_read: int = 0, mapped: int = 0) -> None:
+        with self._lock:
+            self.opens += opens
+            self.reads += reads
+            self.mapped += mapped
+            self.bytes_read += bytes_read
+
+# Default counters; each export counts in its own (RunMetrics.io), passed down
+IO_COUNTERS = IoCounters()
+
+def open_input_file(path: Path, counters: IoCounters = IO_COUNTERS) -> BinaryIO:
+    """Unbuffered binary open, counted in counters."""
+    file = open(path, "rb", buffering=0)
+    counters.add(opens=1)
+    return file
+
+def read_open_file(file: BinaryIO, size: int, counters: IoCounters = IO_COUNTERS) -> bytes:
+    """
+    Read the rest of an open file given its fstat size: for a stable
+    regular file that is a single read call.
+    """
+    # Ask for one byte more than fstat reports: a short read means EOF
+    request_size = size + 1
+    chunks: List[bytes] = []
+    reads = 0
+    while True:
+        chunk = file.read(request_size)
+        reads += 1
+        if chunk:
+            chunks.append(chunk)
+        if len(chunk) < request_size:
+            break
+    data = b"".join(chunks) if len(chunks) != 1 else chunks[0]
+    counters.add(reads=reads, bytes_read=len(data))
+    return data
+
+def read_file_bytes(path: Path) -> bytes:
+    """
+    Read a whole file with one open and, for a stable regular file, one read.
+    The buffer then feeds binary detection, every decode attempt and the output.
+    """
+    with open_input_file(path) as file:
+        return read_open_file(file, os.fstat(file.fileno()).st_size)
+
+def _sniff_utf16_nul_layout(sample: bytes) -> Optional[str]:
+    """Recognise BOM-less UTF-16 by NUL high bytes on one side of each code unit."""
+    if len(sample) < 4:
+        return None
+    even, odd = sample[0::2], sample[1::2]
+    even_nuls, odd_nuls = even.count(0), odd.count(0)
+    if odd_nuls >= len(odd) * UTF16_NUL_RATIO and even_nuls <= len(even) * (1 - UTF16_NUL_RATIO) / 4:
+        return "utf-16-le"
+    if even_nuls >= len(even) * UTF16_NUL_RATIO and odd_nuls <= len(odd) * (1 - UTF16_NUL_RATIO) / 4:
+        return "utf-16-be"
+    return None
+
+def sniff_encoding(sample: bytes) -> str:
+    """
+    Pick the encoding of a file from its first bytes, without trial decodes:
+    BOM, NUL layout of BOM-less UTF-16, pure ASCII, UTF-8 validity.
+    Anything else is cp1252 (decode_text_bytes falls back to latin-1).
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        return "utf-32"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if 0 in sample:
+        utf16 = _sniff_utf16_nul_layout(sample)
+        if utf16 is not None:
+            return utf16
+    if sample.isascii():
+        return "ascii"
+    if _is_utf8_prefix(sample):
+        return "utf-8"
+    return "cp1252"
+
+def _decode_attempts(encoding: str) -> List[tuple[str, str]]:
+    """(encoding, errors) pairs to try, in order, for a sniffed encoding."""
+    if encoding.startswith(("utf-16", "utf-32")):
+        # A BOM or the NUL layout is strong evidence: keep the encoding and
+        # mark damaged code units rather than reinterpreting the whole file
+        return [(encoding, "replace")]
+    # UTF-8 can still fail after a valid prefix
+    return [(encoding, "strict")] + [
+        (fallback, "strict")
+        for fallback in ("cp1252", "latin-1")
+        if fallback != encoding
+    ]
+
+def decode_text_bytes(data: bytes, encoding: Optional[str] = None) -> tuple[Optional[str], Optional[str]]:
+    """
+    Decode an in-memory file with the sniffed encoding, normally in a single decode.
+    Returns (text, encoding_used). Newlines are translated as text-mode
+    open() does (CRLF and CR become LF).
+    """
+    if encoding is None:
+        encoding = sniff_encoding(data[:ENCODING_SNIFF_SIZE])
+    if encoding == "ascii" and not data.isascii():
+        encoding = "utf-8"  # non-ASCII bytes after the sniffed prefix
+
+    for attempt, errors in _decode_attempts(encoding):
+        try:
+            text = data.decode(attempt, errors)
+        except UnicodeDecodeError:
+            continue
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text, attempt
+    return None, None
+
+def read_text_safely(path: Path) -> Optional[str]:
+    try:
+        return decode_text_bytes(read_file_bytes(path))[0]
+    except Exception:
+        return None
+
+def _stream_decoded_text(source: BinaryIO, encoding: str, errors: str, output: "OutputWriter") -> bool:
+    """
+    Decode source chunk by chunk into output, translating newlines and
+    dropping trailing whitespace like content.rstrip(). Only a pending CR and
+    the current run of trailing whitespace are kept between chunks.
+    Returns True if every chunk was ASCII.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    held_whitespace = ""
+    pending_cr = False
+    all_ascii = True
+    reads = bytes_read = 0
+
+    while True:
+        chunk = source.read(STREAM_CHUNK_SIZE)
+        reads += 1
+        bytes_read += len(chunk)
+        all_ascii = all_ascii and chunk.isascii()
+        text = decoder.decode(chunk, final=not chunk)
+
+        if pending_cr:
+            text = "\r" + text
+        pending_cr = bool(chunk) and text.endswith("\r")  # may pair with a LF in the next chunk
+        if pending_cr:
+            text = text[:-1]
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        stripped = text.rstrip()
+        if stripped:
+            output.write_text(held_whitespace + stripped)
+            held_whitespace = text[len(stripped):]
+        else:
+            held_whitespace += text
+
+        if not chunk:
+            break
+
+    output.counters.add(reads=reads, bytes_read=bytes_read)
+    return all_ascii
+
+def copy_text_stream(source: BinaryIO, encoding: str, output: "OutputWriter") -> str:
+    """
+    Copy a large file into output with bounded memory.
+    Follows the same fallbacks as decode_text_bytes: if the sniffed encoding
+    fails midway, output is rewound to where this file started and the next
+    encoding is tried. Returns the encoding used.
+    """
+    start = output.tell()
+    attempts = _decode_attempts("utf-8" if encoding == "ascii" else encoding)
+    for attempt, errors in attempts:
+        source.seek(0)
+        try:
+            all_ascii = _stream_decoded_text(source, attempt, errors, output)
+        except UnicodeDecodeError:
+            output.rewind(start)
+            continue
+        return "ascii" if all_ascii and attempt == "utf-8" else attempt
+    raise UnicodeDecodeError(encoding, b"", 0, 0, "no fallback encoding succeeded")
+
+# =========================
+# Passthrough UTF-8 (zero-copy)
+# =========================
+
+# What str.rstrip() removes among ASCII characters
+_ASCII_WHITESPACE = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+def utf8_rstrip_length(data) -> int:
+    """
+    Length of valid UTF-8 data once the trailing whitespace str.rstrip()
+    would remove is cut off. Walks back from the end: no copy of data.
+    """
+    end = len(data)
+    while end > 0:
+        byte = data[end - 1]
+        if byte < 0x80:
+            if byte not in _ASCII_WHITESPACE:
+                break
+            end -= 1
+            continue
+        start = end - 1
+        while start > 0 and data[start] & 0xC0 == 0x80:
+            start -= 1
+        if not bytes(data[start:end]).decode("utf-8").isspace():
+            break
+        end = start
+    return end
+
+def passthrough_encoding(data: bytes, encoding: str) -> Optional[str]:
+    """
+    "ascii" or "utf-8" if data can go to the output byte for byte: valid
+    UTF-8 without BOM and without CR (nothing to transcode or normalise).
+    None if it has to be decoded.
+    """
+    if encoding not in ("ascii", "utf-8") or b"\r" in data:
+        return None
+    if data.isascii():
+        return "ascii"
+    try:
+        str(data, "utf-8")  # validation only
+    except UnicodeDecodeError:
+        return None
+    return "utf-8"
+
+def scan_passthrough_length(source: BinaryIO, counters: IoCounters = IO_COUNTERS) -> Optional[tuple[int, str]]:
+    """
+    Chunked passthrough check for a large file (see passthrough_encoding).
+    Returns (bytes_to_copy, encoding), trailing whitespace excluded, or None
+    at the first CR or invalid sequence.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    all_ascii = True
+    content_end = 0
+    offset = 0
+    reads = 0
+    source.seek(0)
+    try:
+        while True:
+            chunk = source.read(STREAM_CHUNK_SIZE)
+            reads += 1
+            if b"\r" in chunk:
+                return None
+            if chunk.isascii() and not decoder.getstate()[0]:
+                stripped_length = len(chunk.rstrip(_ASCII_WHITESPACE))
+                if stripped_length:
+                    content_end = offset + stripped_length
+            else:
+                all_ascii = False
+                text = decoder.decode(chunk, final=not chunk)
+                stripped = text.rstrip()
+                if stripped:
+                    trailing = len(text[len(stripped):].encode("utf-8"))
+                    pending = len(decoder.getstate()[0])
+                    content_end = offset + len(chunk) - pending - trailing
+            offset += len(chunk)
+            if not chunk:
+                break
+    except UnicodeDecodeError:
+        return None
+    finally:
+        counters.add(reads=reads, bytes_read=offset)
+    return content_end, "ascii" if all_ascii else "utf-8"
+
+def _kernel_copy(
+    source_fd: int,
+    target_fd: int,
+    length: int,
+    target_offset: int,
+    source_offset: int = 0,
+) -> int:
+    """
+    Copy length bytes of source_fd from source_offset to target_fd at
+    target_offset with copy_file_range/sendfile, without passing through
+    user space.
+    Returns the bytes copied: 0 where neither call is available (Windows).
+    """
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < length:
+                count = os.copy_file_range(
+                    source_fd,
+                    target_fd,
+                    length - copied,
+                    source_offset + copied,
+                    target_offset + copied,
+                )
+                if count == 0:
+                    break
+                copied += count
+            return copied
+        except OSError:
+            pass  # e.g. EXDEV or ENOSYS on older kernels: try sendfile
+    if hasattr(os, "sendfile"):
+        try:
+            os.lseek(target_fd, target_offset + copied, os.SEEK_SET)
+            while copied < length:
+                count = os.sendfile(target_fd, source_fd, source_offset + copied, length - copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError:
+            pass
+    return copied
+
+# =========================
+# Lettura con mmap (file grandi)
+# =========================
+
+def map_input_file(source: BinaryIO, size: int, counters: IoCounters = IO_COUNTERS):
+    """
+    Read-only mapping of the first size bytes of an open file, or None
+    where the file cannot be mapped (the caller reads it instead).
+    A file truncated while mapped raises SIGBUS on POSIX: --no-mmap
+    avoids mappings on inputs that may shrink under the export.
+    """
+    import mmap
+
+    try:
+        mapping = mmap.mmap(source.fileno(), size, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    counters.add(mapped=1)
+    return mapping
+
+def release_mapped_window(mapping, start: int, end: int) -> None:
+    """
+    Drop the pages of [start, end) from the process once they are used, so
+    scanning or copying a mapping keeps a window, not the file, resident.
+    The pages are clean file pages: nothing is lost, they stay in the page cache.
+    """
+    import mmap
+
+    if hasattr(mmap, "MADV_DONTNEED"):
+        start -= start % mmap.PAGESIZE
+        mapping.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+def scan_mapped_passthrough(mapping, size: int, counters: IoCounters = IO_COUNTERS) -> Optional[tuple[int, str]]:
+    """
+    scan_passthrough_length() on a mapping: CR search and UTF-8 validation
+    run window by window on the mapped pages (no read() buffers); each
+    window is decoded once, and only while it lasts.
+    """
+    all_ascii = True
+    content_end = 0
+    offset = 0
+    try:
+        with memoryview(mapping) as view:
+            while offset < size:
+                end = min(offset + STREAM_CHUNK_SIZE, size)
+                if mapping.find(b"\r", offset, end) != -1:
+                    return None
+                text, consumed = codecs.utf_8_decode(view[offset:end], "strict", end == size)
+                release_mapped_window(mapping, offset, end)
+                ascii_text = text.isascii()  # O(1) on str
+                all_ascii = all_ascii and ascii_text
+                stripped = text.rstrip() if text[-1:].isspace() else text
+                if stripped:
+                    trailing = text[len(stripped):]
+                    content_end = offset + consumed - (len(trailing) if ascii_text else len(trailing.encode("utf-8")))
+                offset += consumed
+    except UnicodeDecodeError:
+        return None
+    finally:
+        counters.add(bytes_read=offset)
+    return content_end, "ascii" if all_ascii else "utf-8"
+
+# =========================
+# Scrittura output
+# =========================
+
+def _regular_file_descriptor(file: BinaryIO) -> Optional[int]:
+    """
+    Descriptor of file if bytes written to it land unchanged in a regular
+    file, so the kernel may copy into it; None for memory buffers, pipes,
+    sockets and wrappers that transform the data (e.g. compressors).
+    """
+    from stat import S_ISREG
+
+    target = getattr(file, "file", file)  # tempfile wrappers
+    if not isinstance(target, (io.BufferedWriter, io.BufferedRandom, io.FileIO)):
+        return None
+    try:
+        descriptor = target.fileno()
+        return descriptor if S_ISREG(os.fstat(descriptor).st_mode) else None
+    except (OSError, ValueError):
+        return None
+
+class OutputWriter:
+    """
+    Binary sink for the merged output. Text is written as UTF-8 with LF
+    newlines; clean UTF-8 files are written as raw bytes, or copied
+    file-to-file by the kernel when the sink is a regular file.
+
+    Any binary file-like object works as a sink: the position is tracked
+    here, and on sinks that cannot seek back, streamed files are staged in
+    a temporary file so a failed section never reaches the output.
+    """
+
+    mmap_threshold: Optional[int] = MMAP_THRESHOLD_BYTES  # None = never map sources
+
+    def __init__(self, file: BinaryIO, counters: IoCounters = IO_COUNTERS):
+        self.counters = counters
+        self.kernel_copies = 0
+        self._attach(file)
+
+    def _attach(self, file: BinaryIO) -> None:
+        self.file = file
+        try:
+            self.seekable = file.seekable()
+        except (AttributeError, ValueError):
+            self.seekable = False
+        self.position = file.tell() if self.seekable else 0
+        self._descriptor = _regular_file_descriptor(file) if self.seekable else None
+
+    def written(self) -> int:
+        """Bytes of output so far (all parts, for a sharded output)."""
+        return self.position
+
+    def begin_section(self, result: "FileResult") -> None:
+        """Called before a section is written, before its start is taken with tell()."""
+
+    def end_of_sections(self) -> None:
+        """Called after the last section, before the summary."""
+
+    def write_text(self, text: str) -> None:
+        self.write_bytes(text.encode("utf-8"))
+
+    def write_bytes(self, data) -> None:
+        self.file.write(data)
+        self.position += len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def rewind(self, position: int) -> None:
+        self.file.seek(position)
+        self.file.truncate()
+        self.position = position
+
+    def copy_from(self, source: BinaryIO, length: int, offset: int = 0) -> None:
+        """Append length bytes of source from offset, in the kernel when possible."""
+        copied = 0
+        if self._descriptor is not None:
+            self.file.flush()
+            copied = _kernel_copy(source.fileno(), self._descriptor, length, self.position, offset)
+            self.file.seek(self.position + copied)  # resync the buffered file object
+            self.position += copied
+            if copied:
+                self.kernel_copies += 1
+                self.counters.add(bytes_read=copied)
+
+        remaining = length - copied
+        if self.mmap_threshold is not None and remaining >= self.mmap_threshold:
+            if self._copy_mapped(source, offset + copied, remaining):
+                return
+        source.seek(offset + copied)
+        while remaining:
+            chunk = source.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise OSError(f"File shrank while copying ({remaining} bytes missing)")
+            self.counters.add(reads=1, bytes_read=len(chunk))
+            self.write_bytes(chunk)
+            remaining -= len(chunk)
+
+    def _copy_mapped(self, source: BinaryIO, offset: int, length: int) -> bool:
+        """Write a range of source straight from a mapping; False if it cannot be mapped."""
+        end = offset + length
+        if os.fstat(source.fileno()).st_size < end:
+            raise OSError(f"File shrank while copying ({end - os.fstat(source.fileno()).st_size} bytes missing)")
+        mapping = map_input_file(source, end, self.counters)
+        if mapping is None:
+            return False
+        with mapping, memoryview(mapping) as view:
+            while offset < end:
+                window_end = min(offset + STREAM_CHUNK_SIZE, end)
+                self.write_bytes(view[offset:window_end])
+                release_mapped_window(mapping, offset, window_end)
+                self.counters.add(bytes_read=window_end - offset)
+                offset = window_end
+        return True
+
+    def copy_section(self, source: BinaryIO, offset: int, length: int) -> None:
+        """Copy a complete section of a previous output (--incremental)."""
+        section_start = self.tell()
+        try:
+            self.copy_from(source, length, offset)
+        except Exception:
+            self.rewind(section_start)
+            raise
+
+    def write_section(self, result: "FileResult") -> str:
+        """
+        Write one included file as a "=== name ===" section, or a duplicate
+        as a "=== name === (identical to X)" line.
+        Returns the encoding actually used; on error nothing of the section
+        remains in the output.
+        """
+        if result.duplicate_of is not None:
+            self.write_text(section_header(result.relative_name, result.duplicate_of))
+            return result.encoding
+        if not self.seekable and result.source is not None:
+            return self._write_staged_section(result)
+        section_start = self.tell()
+        try:
+            self.write_text(section_header(result.relative_name))
+            if result.raw is not None:
+                self.write_bytes(result.raw)
+            elif result.source is not None and result.copy_length is not None:
+                self.copy_from(result.source, result.copy_length)
+            elif result.source is not None:
+                result.encoding = copy_text_stream(result.source, result.encoding, self)
+            else:
+                self.write_text(result.content.rstrip())
+            self.write_text("\n")
+        except Exception:
+            self.rewind(section_start)
+            raise
+        finally:
+            if result.source is not None:
+                result.source.close()
+        return result.encoding
+
+    def _write_staged_section(self, result: "FileResult") -> str:
+        import tempfile
+
+        with tempfile.TemporaryFile() as staging_file:
+            staging = OutputWriter(staging_file, self.counters)
+            staging.mmap_threshold = self.mmap_threshold
+            encoding = staging.write_section(result)
+            self.kernel_copies += staging.kernel_copies
+            staging_file.seek(0)
+            while True:
+                chunk = staging_file.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.write_bytes(chunk)
+        return encoding
+
+# =========================
+# Compressione dell'output (--compress)
+# =========================
+
+class BlockCompressor(io.RawIOBase):
+    """
+    Write-only gzip/xz stream compressed on several cores: data is cut into
+    COMPRESS_BLOCK_SIZE blocks, each compressed on a thread pool as an
+    independent gzip member / xz stream and written in order. Both formats
+    allow concatenated members, so gunzip, xz and Python's gzip/lzma read
+    the result as one file. zlib and liblzma release the GIL while
+    compressing. The underlying file is not closed.
+    """
+
+    def __init__(self, file: BinaryIO, compress_block: Callable[[bytes], bytes], workers: int):
+        super().__init__()
+        self.file = file
+        self._compress_block = compress_block
+        self._buffer = bytearray()
+        self._pending: deque = deque()
+        self._executor = None
+        self._max_pending = workers * 2
+        if workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{APP_NAME}-compress")
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= COMPRESS_BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:COMPRESS_BLOCK_SIZE]))
+            del self._buffer[:COMPRESS_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        if self._executor is None:
+            self.file.write(self._compress_block(block))
+            return
+        self._pending.append(self._executor.submit(self._compress_block, block))
+        while len(self._pending) > self._max_pending:
+            self.file.write(self._pending.popleft().result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self.file.write(self._pending.popleft().result())
+            self.file.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+            super().close()
+
+def open_compressed_sink(file: BinaryIO, codec: str, workers: int = DEFAULT_COMPRESS_WORKERS) -> BinaryIO:
+    """
+    Wrap file in a streaming compressor ("gzip", "xz" or "zstd"); closing
+    the wrapper finishes the compressed stream but leaves file open.
+    zstd needs the optional zstandard module and uses its own threads.
+    """
+    if codec == "gzip":
+        import gzip
+        return BlockCompressor(file, partial(gzip.compress, compresslevel=6, mtime=0), workers)
+    if codec == "xz":
+        import lzma
+        # Preset 3: a 4 MB dictionary, as large as a block (more would be unused)
+        return BlockCompressor(file, partial(lzma.compress, preset=3), workers)
+    if codec == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=3, threads=-1 if workers > 1 else 0)
+        return compressor.stream_writer(file, closefd=False)
+    raise ValueError(f"Unknown compression codec: {codec}")
+
+# =========================
+# Stima dei token (--token-budget / --shard-size)
+# =========================
+
+# Approximate bytes of ASCII text per token, per extension, for BPE tokenizers
+# of the GPT family: punctuation-heavy formats pack fewer bytes per token
+TOKEN_BYTES_PER_EXTENSION = {
+    ".txt": 4.3, ".md": 4.1, ".rst": 4.1, ".adoc": 4.1, ".tex": 3.6, ".rtf": 3.2,
+    ".py": 3.6, ".pyw": 3.6, ".rb": 3.5, ".sh": 3.4, ".bash": 3.4, ".ps1": 3.4,
+    ".java": 3.9, ".kt": 3.7, ".scala": 3.6, ".cs": 3.8, ".go": 3.4, ".rs": 3.4, ".swift": 3.6,
+    ".c": 3.3, ".h": 3.4, ".cpp": 3.3, ".hpp": 3.4,
+    ".js": 3.3, ".mjs": 3.3, ".cjs": 3.3, ".ts": 3.4, ".tsx": 3.2, ".jsx": 3.2, ".php": 3.3,
+    ".html": 3.1, ".htm": 3.1, ".xml": 3.0, ".svg": 2.6, ".xsd": 3.0,
+    ".json": 3.0, ".yaml": 3.4, ".yml": 3.4, ".toml": 3.4, ".ini": 3.5, ".cfg": 3.5,
+    ".csv": 2.6, ".tsv": 2.6, ".sql": 3.5, ".log": 3.2, ".diff": 3.3, ".patch": 3.3,
+    ".pdf": 4.2,
+}
+
+_ASCII_BYTES = bytes(range(128))
+
+def count_non_ascii(data) -> int:
+    """Non-ASCII bytes of data, with C-level passes only (isascii, translate)."""
+    if isinstance(data, memoryview):
+        data = data.obj if isinstance(data.obj, bytes) else data.tobytes()
+    if data.isascii():
+        return 0
+    return len(data.translate(None, _ASCII_BYTES))
+
+def estimate_tokens(byte_count: int, suffix: str = "", non_ascii: int = 0) -> int:
+    """
+    Approximate LLM token count of byte_count bytes of UTF-8 text, without a
+    tokenizer: a per-extension bytes-per-token ratio for the ASCII part and
+    a denser one for the non_ascii bytes.
+    """
+    ratio = TOKEN_BYTES_PER_EXTENSION.get(suffix.lower(), DEFAULT_BYTES_PER_TOKEN)
+    return math.ceil((byte_count - non_ascii) / ratio + non_ascii / NON_ASCII_BYTES_PER_TOKEN)
+
+def section_header(relative_name: str, duplicate_of: Optional[str] = None) -> str:
+    if duplicate_of is not None:
+        return f"\n=== {relative_name} === (identical to {duplicate_of})\n"
+    return f"\n=== {relative_name} ===\n"
+
+def prepare_section_size(result: "FileResult") -> tuple[int, int]:
+    """
+    (bytes, estimated tokens) of the section OutputWriter.write_section()
+    will write for result, known before writing it. Decoded text is encoded
+    here (write_section would encode it anyway) and kept as result.raw.
+    Large files that need transcoding are estimated from their size.
+    """
+    if result.section_estimate is not None:
+        return result.section_estimate
+    if result.duplicate_of is not None:
+        header = len(section_header(result.relative_name, result.duplicate_of).encode("utf-8"))
+        result.section_estimate = header, estimate_tokens(header)
+        return result.section_estimate
+    if result.content is not None:
+        result.raw = memoryview(result.content.rstrip().encode("utf-8"))
+        result.content = None
+    header = len(section_header(result.relative_name).encode("utf-8")) + 1
+    non_ascii = 0
+    if result.raw is not None:
+        body = len(result.raw)
+        if result.encoding != "ascii":
+            non_ascii = count_non_ascii(result.raw)
+    elif result.copy_length is not None:
+        body = result.copy_length
+    else:
+        body = os.fstat(result.source.fileno()).st_size
+    result.section_estimate = header + body, estimate_tokens(header + body, result.path.suffix, non_ascii)
+    return result.section_estimate
+
+class TokenBudget:
+    """
+    --token-budget: admits sections while their estimated tokens still fit.
+    Policy "skip" drops only the files that do not fit and keeps filling the
+    budget with later, smaller ones; "stop" ends the merge at the first file
+    that does not fit, without reading the rest.
+    """
+
+    POLICIES = BUDGET_POLICIES
+
+    def __init__(self, limit: int, policy: str = "skip"):
+        self.limit = limit
+        self.policy = policy
+        self.used = 0
+        self.dropped = 0
+        self.dropped_tokens = 0
+        self.exhausted = False
+
+    def admit(self, tokens: int) -> bool:
+        if not self.exhausted and self.used + tokens <= self.limit:
+            self.used += tokens
+            return True
+        self.drop(tokens)
+        if self.policy == "stop":
+            self.exhausted = True
+        return False
+
+    def drop(self, tokens: int) -> None:
+        self.dropped += 1
+        self.dropped_tokens += tokens
+
+# =========================
+# Output in parti (--shard-size)
+# =========================
+
+def shard_path(output_file: Path, number: int) -> Path:
+    """output-x-<ts>.txt -> output-x-<ts>.part01.txt (compression suffix kept last)."""
+    name = output_file.name
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if name.endswith(".txt" + suffix):
+            stem, tail = name[:-len(".txt" + suffix)], ".txt" + suffix
+            break
+    else:
+        stem, tail = output_file.stem, output_file.suffix
+    return output_file.with_name(f"{stem}.part{number:02d}{tail}")
+
+@dataclass
+class OutputPart:
+    """One part of a sharded output, as written so far."""
+    path: Path
+    files: List[tuple[str, int]] = field(default_factory=list)  # (relative name, section bytes)
+    first_file: int = 0  # 1-based index of its first file in the whole export
+    size: int = 0  # Section bytes
+    tokens: int = 0
+
+class ShardedOutputWriter(OutputWriter):
+    """
+    --shard-size: rolls the output over to a new part file between
+    sections, in one streaming pass. A part is closed before a section
+    that would take it past the limit; sections are never split, so a
+    larger one gets a part of its own. The size of a section is known
+    before it is written, except for large files that need transcoding,
+    where the file size is used. Each part ends with a mini-summary of
+    its files (not counted in the limit), the last one also with the full
+    EXTRACTION SUMMARY; parts are written to temporary files and moved
+    into place as soon as they are complete.
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        limit: int,
+        unit: str,
+        compress: Optional[str] = None,
+        counters: IoCounters = IO_COUNTERS,
+        metrics: Optional["RunMetrics"] = None,
+    ):
+        self.output_file = output_file
+        self.limit = limit
+        self.unit = unit
+        self.compress = compress
+        self.metrics = metrics
+        self.parts: List[OutputPart] = []
+        self._closed_bytes = 0  # Output bytes of the completed parts
+        self._files_written = 0
+        self._resources: Optional[ExitStack] = None
+        self._temporary_path: Optional[Path] = None
+        super().__init__(self._open_part(), counters)
+
+    def _open_part(self) -> BinaryIO:
+        import tempfile
+
+        self._resources = ExitStack()
+        temporary_file = self._resources.enter_context(
+            tempfile.NamedTemporaryFile(mode="w+b", delete=False, suffix=".tmp")
+        )
+        self._temporary_path = Path(temporary_file.name)
+        self.parts.append(OutputPart(shard_path(self.output_file, len(self.parts) + 1), first_file=self._files_written + 1))
+        if self.compress is None:
+            return temporary_file
+        return self._resources.enter_context(closing(open_compressed_sink(temporary_file, self.compress)))
+
+    def _close_part(self) -> None:
+        import shutil
+
+        self._closed_bytes += self.position
+        self._resources.close()
+        self._resources = None
+        part_path = self.parts[-1].path
+        if self.metrics is not None:
+            with self.metrics.phase("move"):
+                shutil.move(self._temporary_path, part_path)
+        else:
+            shutil.move(self._temporary_path, part_path)
+        logging.info("Output part written: %s", part_path)
+
+    def written(self) -> int:
+        return self._closed_bytes + self.position
+
+    def begin_section(self, result: "FileResult") -> None:
+        """Roll over to a new part if the section would not fit in this one."""
+        expected_bytes, expected_tokens = prepare_section_size(result)
+        part = self.parts[-1]
+        if self.unit == "bytes":
+            over_limit = part.size + expected_bytes > self.limit
+        else:
+            over_limit = part.tokens + expected_tokens > self.limit
+        if part.files and over_limit:
+            self._write_part_summary(next_part=shard_path(self.output_file, len(self.parts) + 1))
+            self._close_part()
+            self._attach(self._open_part())
+
+    def write_section(self, result: "FileResult") -> str:
+        self.begin_section(result)  # No-op when the caller already did it
+        expected_tokens = prepare_section_size(result)[1]
+        part = self.parts[-1]
+        section_start = self.tell()
+        encoding = super().write_section(result)
+        length = self.tell() - section_start
+        part.files.append((result.relative_name, length))
+        part.size += length
+        part.tokens += expected_tokens
+        self._files_written += 1
+        return encoding
+
+    def end_of_sections(self) -> None:
+        self._write_part_summary(next_part=None)
+
+    def _write_part_summary(self, next_part: Optional[Path]) -> None:
+        part = self.parts[-1]
+        number = len(self.parts)
+        self.write_text("\n\n")
+        self.write_text("-"*80 + "\n")
+        self.write_text(f"PART {number:02d} SUMMARY\n")
+        self.write_text("-"*80 + "\n\n")
+        self.write_text(f"Part file: {part.path.name}\n")
+        if part.files:
+            last_file = part.first_file + len(part.files) - 1
+            self.write_text(f"Files in this part: {len(part.files)} (files {part.first_file}-{last_file} of the export)\n")
+        else:
+            self.write_text("Files in this part: 0\n")
+        self.write_text(f"Size: {part.size / (1024*1024):.2f} MB, about {part.tokens:,} tokens\n")
+        if next_part is not None:
+            self.write_text(f"Continues in: {next_part.name}\n")
+        else:
+            self.write_text(f"Last part of {number}; the full EXTRACTION SUMMARY follows\n")
+        if part.files:
+            self.write_text(f"\n--- FILES IN THIS PART ({len(part.files)}) ---\n\n")
+            for idx, (relative_name, length) in enumerate(part.files, part.first_file):
+                self.write_text(f"{idx:4}. {relative_name} ({length / 1024:.1f} KB)\n")
+        if next_part is None and number > 1:
+            self.write_text(f"\n--- ALL PARTS ({number}) ---\n\n")
+            for part_number, each in enumerate(self.parts, 1):
+                self.write_text(
+                    f"{part_number:4}. {each.path.name}  {len(each.files)} files, "
+                    f"{each.size / (1024*1024):.2f} MB, about {each.tokens:,} tokens\n"
+                )
+
+    def finish(self) -> List[Path]:
+        """Close and move the last part; returns every part's path."""
+        self._close_part()
+        return [part.path for part in self.parts]
+
+    def discard(self) -> None:
+        """On failure: drop the unfinished part (completed parts stay)."""
+        if self._resources is not None:
+            self._resources.close()
+            self._resources = None
+            self._temporary_path.unlink(missing_ok=True)
+
+# =========================
+# Estrazione PDF
+# =========================
+
+def _read_pdf_pages(reader, start: int, stop: int, deadline: Optional[float]) -> tuple[List[str], bool]:
+    """Text of pages [start, stop) of an open PdfReader; completed is False past deadline."""
+    page_texts: List[str] = []
+    for index in range(start, min(stop, len(reader.pages))):
+        if deadline is not None and time.monotonic() > deadline:
+            return page_texts, False
+        page_texts.append(reader.pages[index].extract_text() or "")
+    return page_texts, True
+
+def _extract_pdf_pages(path: str, start: int, stop: int, time_cap: float) -> tuple[List[str], bool]:
+    """
+    Extract the text of pages [start, stop). Runs inside PDF worker processes.
+    Returns (page_texts, completed): completed is False when time_cap seconds
+    (0 = no cap) ran out before the last page. The cap is checked between pages.
+    """
+    import PyPDF2
+    deadline = time.monotonic() + time_cap if time_cap > 0 else None
+    with open(path, 'rb') as file:
+        return _read_pdf_pages(PyPDF2.PdfReader(file), start, stop, deadline)
+
+def _join_pdf_pages(page_texts: Iterable[str]) -> Optional[str]:
+    full_text = '\n\n'.join(text for text in page_texts if text)
+
+    # Return None if no text extracted (image-only PDF)
+    if not full_text.strip():
+        return None
+
+    return full_text
+
+def extract_pdf_text(path: Path, events: FileEvents = FILE_EVENTS) -> Optional[str]:
+    """
+    Extract text from PDF file in the current process.
+    Returns None if extraction fails or PDF is image-only.
+    """
+    try:
+        page_texts, _ = _extract_pdf_pages(str(path), 0, sys.maxsize, 0)
+        return _join_pdf_pages(page_texts)
+
+    except ImportError:
+        events.record("PyPDF2 missing", logging.WARNING, "PyPDF2 not installed - PDF support disabled")
+        return None
+    except Exception as e:
+        events.record("PDF extraction failed", logging.DEBUG, "PDF extraction failed: %s: %s", path, e)
+        return None
+
+PDF_FAILED_REASON = "PDF text extraction failed (image-only or encrypted)"
+PDF_TIME_CAP_REASON = "PDF extraction exceeded time cap"
+
+def pdf_time_cap_reason(time_cap: float) -> str:
+    return f"{PDF_TIME_CAP_REASON} (>{time_cap:g}s)"
+
+def is_pdf_time_cap_reason(reason: str) -> bool:
+    return reason.startswith(PDF_TIME_CAP_REASON)
+
+def pdf_support_available() -> bool:
+    """False without PyPDF2: its failures say nothing about the file and are not cached."""
+    import importlib.util
+    return importlib.util.find_spec("PyPDF2") is not None
+
+class PdfExtractor:
+    """
+    Extract PDF text on a process pool (PyPDF2 parsing is CPU-bound and holds the GIL).
+
+    The page count is read in this process. Documents of up to
+    pages_per_task pages are extracted here too, from the same parse: a
+    worker would only add its start-up and a second parse. Longer ones are
+    split into page ranges that run on different workers and are
+    reassembled in page order. Each document gets time_cap seconds in all:
+    the parent waits on its ranges until that deadline, and a PDF over the
+    cap is excluded instead of stalling the export. A worker still busy at
+    the deadline (e.g. stuck inside one page) is killed with its pool, and
+    the next PDF starts a fresh one. In-process extraction (short documents,
+    or workers = 0) can only check the cap between pages.
+    The pool starts lazily, on the first PDF that gets split.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_PDF_WORKERS,
+        pages_per_task: int = PDF_PAGES_PER_TASK,
+        time_cap: float = DEFAULT_PDF_TIME_CAP_SECONDS,
+    ):
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.time_cap = time_cap
+        self._executor: Optional["ProcessPoolExecutor"] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> "ProcessPoolExecutor":
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # spawn: forking while worker threads hold locks is unsafe,
+                # and it matches what Windows does anyway
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logging.debug("PDF process pool started (%d workers)", self.workers)
+            return self._executor
+
+    def _recycle_pool(self, pool: "ProcessPoolExecutor") -> None:
+        """Kill the workers of a pool that ran past a deadline; the next PDF starts a new pool."""
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        # No public way to stop a busy worker before Python 3.14 (terminate_workers)
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        logging.debug("PDF process pool recycled after a time cap")
+
+    def _page_ranges(self, path: Path) -> Iterator[tuple[List[str], bool]]:
+        if self.workers <= 0:
+            yield _extract_pdf_pages(str(path), 0, sys.maxsize, self.time_cap)
+            return
+
+        import PyPDF2
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+
+        deadline = time.monotonic() + self.time_cap if self.time_cap > 0 else None
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        with open(path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            page_count = len(reader.pages)
+            if page_count <= self.pages_per_task:
+                yield _read_pdf_pages(reader, 0, page_count, deadline)
+                return
+
+        pool = self._pool()
+        futures = []
+        try:
+            futures = [
+                pool.submit(
+                    _extract_pdf_pages,
+                    str(path),
+                    start,
+                    start + self.pages_per_task,
+                    0 if deadline is None else max(remaining(), 0.001),  # Workers stop between pages too
+                )
+                for start in range(0, page_count, self.pages_per_task)
+            ]
+            for future in futures:
+                yield future.result(timeout=remaining())
+        except FutureTimeoutError:
+            self._recycle_pool(pool)
+            yield [], False
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def extract(self, path: Path, events: FileEvents = FILE_EVENTS) -> tuple[Optional[str], Optional[str]]:
+        """Returns (text, None) on success, (None, exclusion_reason) otherwise."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        try:
+            return self._extract(path, events)
+        except BrokenProcessPool:
+            # The pool was recycled for another document's time cap: retry once on a new one
+            return self._extract(path, events)
+
+    def _extract(self, path: Path, events: FileEvents) -> tuple[Optional[str], Optional[str]]:
+        from concurrent.futures.process import BrokenProcessPool
+
+        page_texts: List[str] = []
+        try:
+            for chunk, completed in self._page_ranges(path):
+                if not completed:
+                    events.record(
+                        "PDF time cap",
+                        logging.WARNING,
+                        "PDF extraction capped after %gs: %s",
+                        self.time_cap,
+                        path,
+                    )
+                    return None, pdf_time_cap_reason(self.time_cap)
+                page_texts.extend(chunk)
+
+        except ImportError:
+            events.record("PyPDF2 missing", logging.WARNING, "PyPDF2 not installed - PDF support disabled")
+            return None, PDF_FAILED_REASON
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            events.record("PDF extraction failed", logging.DEBUG, "PDF extraction failed: %s: %s", path, e)
+            return None, PDF_FAILED_REASON
+
+        content = _join_pdf_pages(page_texts)
+        return (content, None) if content is not None else (None, PDF_FAILED_REASON)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+# =========================
+# Cache persistente delle estrazioni
+# =========================
+
+def default_cache_path() -> Path:
+    return app_data_directory() / "cache" / "extraction.sqlite3"
+
+@dataclass
+class CacheEntry:
+    """What the pipeline learned about one version of a file."""
+    reason: Optional[str] = None  # Exclusion verdict, e.g. "Binary file detected"
+    encoding: Optional[str] = None
+    passthrough: bool = False  # Clean UTF-8/ASCII: written without decoding
+    copy_length: Optional[int] = None  # Streamed passthrough: bytes to copy
+    text: Optional[str] = None  # Extracted text of expensive types (PDF)
+
+class ExtractionCache:
+    """
+    On-disk cache of per-file verdicts, keyed by (resolved path, size, mtime_ns).
+
+    SQLite in WAL mode, so several exports can share it. Lookups hit the
+    database directly; new entries and access times are buffered and written
+    in one transaction by close(), which then evicts the least recently used
+    entries above max_bytes. Any database error disables the cache for the
+    rest of the run: the export never depends on it.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pending: dict[str, tuple] = {}
+        self._accessed: Set[str] = set()
+        self._lock = threading.Lock()
+        import sqlite3
+
+        self._connection: Optional["sqlite3.Connection"] = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                self._connection = self._connect()
+            except sqlite3.DatabaseError as error:
+                # Not a database (e.g. truncated by a crash): start over
+                logging.warning("Extraction cache unreadable, recreating: %s", error)
+                for suffix in ("", "-wal", "-shm"):
+                    Path(f"{path}{suffix}").unlink(missing_ok=True)
+                self._connection = self._connect()
+            logging.debug("Extraction cache: %s", path)
+        except (sqlite3.Error, OSError) as error:
+            logging.warning("Extraction cache disabled: %s", error)
+
+    def _connect(self) -> "sqlite3.Connection":
+        import sqlite3
+
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+                with connection:
+                    connection.execute("DROP TABLE IF EXISTS entries")
+                    connection.execute(
+                        "CREATE TABLE entries ("
+                        " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+                        " reason TEXT, encoding TEXT, passthrough INTEGER,"
+                        " copy_length INTEGER, text BLOB, nbytes INTEGER, accessed REAL)"
+                    )
+                    connection.execute("CREATE INDEX entries_accessed ON entries (accessed)")
+                    connection.execute(f"PRAGMA user_version={CACHE_SCHEMA_VERSION}")
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _disable(self, error: Exception) -> None:
+        logging.warning("Extraction cache disabled: %s", error)
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+    def get(self, path: Path, stat: os.stat_result) -> Optional[CacheEntry]:
+        import sqlite3
+        import zlib
+
+        key = str(path)
+        with self._lock:
+            if self._connection is None:
+                return None
+            try:
+                row = self._connection.execute(
+                    "SELECT reason, encoding, passthrough, copy_length, text FROM entries"
+                    " WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (key, stat.st_size, stat.st_mtime_ns),
+                ).fetchone()
+            except sqlite3.Error as error:
+                self._disable(error)
+                return None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed.add(key)
+
+        reason, encoding, passthrough, copy_length, text = row
+        if text is not None:
+            text = zlib.decompress(text).decode("utf-8")
+        return CacheEntry(reason, encoding, bool(passthrough), copy_length, text)
+
+    def put(self, path: Path, stat: os.stat_result, entry: CacheEntry) -> None:
+        import zlib
+
+        # A file written within the mtime granularity may change again
+        # without its (size, mtime) changing: don't trust it yet
+        if time.time_ns() - stat.st_mtime_ns < RACY_MTIME_WINDOW_NS:
+            return
+        key = str(path)
+        text = zlib.compress(entry.text.encode("utf-8"), 1) if entry.text is not None else None
+        row = (
+            key,
+            stat.st_size,
+            stat.st_mtime_ns,
+            entry.reason,
+            entry.encoding,
+            int(entry.passthrough),
+            entry.copy_length,
+            text,
+            len(key) + (len(text) if text is not None else 0) + 64,
+        )
+        with self._lock:
+            if self._connection is not None:
+                self._pending[key] = row
+
+    def flush(self) -> None:
+        """Write buffered entries and access times, then evict."""
+        import sqlite3
+
+        with self._lock:
+            if self._connection is None:
+                return
+            pending, self._pending = self._pending, {}
+            accessed, self._accessed = self._accessed, set()
+            now = time.time()
+            try:
+                with self._connection as connection:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (row + (now,) for row in pending.values()),
+                    )
+                    connection.executemany(
+                        "UPDATE entries SET accessed = ? WHERE path = ?",
+                        ((now, key) for key in accessed - pending.keys()),
+                    )
+                    self._evict(connection)
+            except sqlite3.Error as error:
+                logging.warning("Extraction cache not saved: %s", error)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            connection.close()
+
+    def _evict(self, connection: "sqlite3.Connection") -> None:
+        total = connection.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        victims: List[tuple[str]] = []
+        for key, nbytes in connection.execute("SELECT path, nbytes FROM entries ORDER BY accessed"):
+            victims.append((key,))
+            excess -= nbytes
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM entries WHERE path = ?", victims)
+        logging.debug("Extraction cache: evicted %d entries", len(victims))
+
+def validate_selection(arguments: Iterable[str]) -> tuple[bool, str]:
+    """
+    Validate user selection according to context menu rules.
+    Returns (is_valid, error_message).
+
+    Rules:
+    1. Single file: Must be supported extension
+    2. Multi-selection with folders: Always valid
+    3. Multi-selection files only: At least one must be supported
+    """
+    paths = []
+    for argument in arguments:
+        sanitized = sanitize_argument(argument)
+        if sanitized:
+            path = Path(sanitized).expanduser().resolve()
+            if path.exists():
+                paths.append(path)
+
+    if not paths:
+        return False, "No valid paths provided."
+
+    # Check if any path is a directory
+    has_directory = any(p.is_dir() for p in paths)
+
+    # CASE 2: Multi-selection with at least one folder -> Always valid
+    if has_directory:
+        return True, ""
+
+    # Get only files
+    files = [p for p in paths if p.is_file()]
+
+    if not files:
+        return False, "No valid files in selection."
+
+    # CASE 1: Single file
+    if len(files) == 1:
+        if is_supported_file(files[0]):
+            return True, ""
+        else:
+            ext = files[0].suffix.lower() or "(no extension)"
+            return False, f"File type '{ext}' is not supported.\n\nSupported types include: .txt, .py, .java, .js, .md, .json, .pdf, and 60+ more.\n\nSee documentation for full list."
+
+    # CASE 3: Multi-selection files only
+    # At least one must be supported
+    supported_files = [f for f in files if is_supported_file(f)]
+
+    if supported_files:
+        return True, ""
+    else:
+        # Show first few unsupported extensions
+        unsupported_exts = list(set(f.suffix.lower() for f in files[:5]))
+        ext_list = ", ".join(unsupported_exts)
+        return False, f"None of the selected files are supported.\n\nUnsupported types: {ext_list}\n\nSupported types include: .txt, .py, .java, .js, .md, .json, .pdf, and 60+ more."
+
+# =========================
+# Regole di esclusione (.gitignore / .ignore)
+# =========================
+
+def _translate_ignore_glob(pattern: str) -> str:
+    """gitignore glob -> regex: * and ? stop at '/', ** spans directories."""
+    parts: List[str] = []
+    index = 0
+    length = len(pattern)
+    while index < length:
+        char = pattern[index]
+        if char == "*":
+            if pattern.startswith("**", index):
+                at_start = index == 0 or pattern[index - 1] == "/"
+                index += 2
+                if at_start and pattern.startswith("/", index):
+                    parts.append("(?:.*/)?")  # "**/": zero or more directories
+                    index += 1
+                elif at_start and index == length:
+                    parts.append(".*")  # "/**": everything inside
+                else:
+                    parts.append("[^/]*")
+                continue
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            close = pattern.find("]", index + 2 if pattern.startswith(("[!", "[^"), index) else index + 1)
+            if close == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[index + 1:close]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                parts.append("[" + body.replace("\\", "\\\\") + "]")
+                index = close
+        elif char == "\\" and index + 1 < length:
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return "".join(parts)
+
+@dataclass(frozen=True)
+class IgnoreRule:
+    regex: "re.Pattern[str]"
+    negated: bool
+    directory_only: bool
+
+def compile_ignore_pattern(line: str) -> Optional[IgnoreRule]:
+    """One .gitignore line -> IgnoreRule (None for blanks and comments)."""
+    line = line.rstrip("\r\n")
+    if not line.endswith("\\ "):
+        line = line.rstrip(" ")
+    if not line or line.startswith("#"):
+        return None
+
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    elif line.startswith(("\\#", "\\!")):
+        line = line[1:]
+
+    directory_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    # A slash at the start or in the middle anchors the pattern to the
+    # directory of the ignore file; otherwise it matches at any depth
+    if "/" in line:
+        expression = _translate_ignore_glob(line.lstrip("/"))
+    else:
+        expression = "(?:.*/)?" + _translate_ignore_glob(line)
+    return IgnoreRule(re.compile(expression, re.DOTALL), negated, directory_only)
+
+class IgnoreRuleSet:
+    """The rules of one ignore file (or of --include/--exclude), relative to base."""
+
+    def __init__(self, base: str, rules: List[IgnoreRule]):
+        self.prefix_length = len(base.rstrip(os.sep)) + 1
+        self.rules = rules
+        # One alternation rejects most paths without trying rule by rule
+        self.any_rule = re.compile(
+            "|".join(f"(?:{rule.regex.pattern})" for rule in rules),
+            re.DOTALL,
+        )
+
+    @classmethod
+    def from_lines(cls, base: str, lines: Iterable[str]) -> Optional["IgnoreRuleSet"]:
+        rules = [rule for rule in map(compile_ignore_pattern, lines) if rule is not None]
+        return cls(base, rules) if rules else None
+
+    @classmethod
+    def from_file(cls, base: str, path: str, events: FileEvents = FILE_EVENTS) -> Optional["IgnoreRuleSet"]:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as file:
+                return cls.from_lines(base, file.read().splitlines())
+        except OSError as error:
+            events.record("unreadable ignore file", logging.DEBUG, "Cannot read ignore file %s: %s", path, error)
+            return None
+
+    def match(self, path: str, is_directory: bool) -> Optional[bool]:
+        """True = ignored, False = re-included by a '!' rule, None = no rule matches."""
+        relative = path[self.prefix_length:]
+        if os.sep != "/":
+            relative = relative.replace(os.sep, "/")
+        if not self.any_rule.fullmatch(relative):
+            return None
+        for rule in reversed(self.rules):  # The last matching rule wins
+            if rule.directory_only and not is_directory:
+                continue
+            if rule.regex.fullmatch(relative):
+                return not rule.negated
+        return None
+
+class IgnoreMatcher:
+    """
+    Ignore rules in effect in one directory: the user's --exclude/--include
+    globs plus every ignore file from the walk root (or its repository root)
+    down. Each directory's matcher is built once and handed to its
+    subdirectories, so no ignore file is parsed twice.
+    """
+
+    def __init__(
+        self,
+        rule_sets: tuple[IgnoreRuleSet, ...] = (),
+        excludes: Optional[IgnoreRuleSet] = None,
+        includes: Optional[IgnoreRuleSet] = None,
+        read_ignore_files: bool = True,
+        events: FileEvents = FILE_EVENTS,
+    ):
+        self.rule_sets = rule_sets
+        self.excludes = excludes
+        self.includes = includes
+        self.read_ignore_files = read_ignore_files
+        self.events = events  # Unreadable ignore files and directories of the walk
+
+    @classmethod
+    def for_root(
+        cls,
+        root: str,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        read_ignore_files: bool = True,
+        events: FileEvents = FILE_EVENTS,
+    ) -> "IgnoreMatcher":
+        """
+        Matcher for a walk root. Ignore files of the enclosing git
+        repository, if any, apply as well: right-clicking a subfolder
+        gives the same result as selecting the whole repository.
+        """
+        matcher = cls(
+            excludes=IgnoreRuleSet.from_lines(root, exclude),
+            includes=IgnoreRuleSet.from_lines(root, include),
+            read_ignore_files=read_ignore_files,
+            events=events,
+        )
+        if read_ignore_files:
+            ancestors: List[str] = []
+            for parent in Path(root).parents:
+                ancestors.append(str(parent))
+                if (parent / ".git").exists():
+                    for ancestor in reversed(ancestors):
+                        present = [name for name in IGNORE_FILE_NAMES if os.path.exists(os.path.join(ancestor, name))]
+                        matcher = matcher.for_directory(ancestor, present)
+                    break
+        return matcher
+
+    def for_directory(self, directory: str, names: Iterable[str]) -> "IgnoreMatcher":
+        """Matcher for `directory`, given the names of its entries."""
+        if not self.read_ignore_files:
+            return self
+        rule_sets = self.rule_sets
+        for name in IGNORE_FILE_NAMES:
+            if name in names:
+                rule_set = IgnoreRuleSet.from_file(directory, os.path.join(directory, name), self.events)
+                if rule_set is not None:
+                    rule_sets += (rule_set,)
+        if rule_sets is self.rule_sets:
+            return self
+        return IgnoreMatcher(rule_sets, self.excludes, self.includes, self.read_ignore_files, self.events)
+
+    def is_ignored(self, path: str, is_directory: bool) -> bool:
+        if self.excludes is not None and self.excludes.match(path, is_directory):
+            return True
+        for rule_set in reversed(self.rule_sets):  # Deeper ignore files win
+            verdict = rule_set.match(path, is_directory)
+            if verdict is not None:
+                return verdict
+        return False
+
+    def is_included(self, path: str) -> bool:
+        """--include: the file, or the nearest of its folders below the root a rule matches."""
+        if self.includes is None:
+            return True
+        verdict = self.includes.match(path, False)
+        directory = os.path.dirname(path)
+        while verdict is None and len(directory) >= self.includes.prefix_length:
+            verdict = self.includes.match(directory, True)
+            directory = os.path.dirname(directory)
+        return bool(verdict)
+
+REASON_UNSUPPORTED = "Unsupported file type"
+REASON_PREVIOUS_OUTPUT = "Previous output file"
+REASON_IGNORED = "Ignored by .gitignore/.ignore or --exclude"
+REASON_NOT_INCLUDED = "Not matched by --include"
+REASON_TOKEN_BUDGET = "Over the --token-budget"
+
+@dataclass
+class ScanStats:
+    """What expand_input_paths pruned, counted instead of materialised as Paths."""
+    skipped: Counter = field(default_factory=Counter)  # reason -> files
+    # Directories holding at least one scanned file: their common path is
+    # the common path of every scanned file
+    directories: Set[str] = field(default_factory=set)
+    pruned_directories: int = 0  # Ignored directories, not descended into
+
+    @property
+    def total_skipped(self) -> int:
+        return sum(self.skipped.values())
+
+    def merge(self, other: "ScanStats") -> None:
+        self.skipped.update(other.skipped)
+        self.directories.update(other.directories)
+        self.pruned_directories += other.pruned_directories
+
+def _accept_file(
+    name: str,
+    path: str,
+    get_stat: Callable[[], os.stat_result],
+    max_size_bytes: Optional[int],
+    stats: ScanStats,
+    events: FileEvents,
+) -> bool:
+    if not is_supported_name(name):
+        # Always log when skipping output-*.txt files (important for user visibility)
+        if is_previous_output_name(name):
+            events.record("previous output skipped", logging.INFO, "Skipped previous output file: %s", path)
+            stats.skipped[REASON_PREVIOUS_OUTPUT] += 1
+        else:
+            stats.skipped[REASON_UNSUPPORTED] += 1
+            if DEV_MODE:
+                logging.debug("Skipped unsupported file: %s", path)
+        return False
+
+    if max_size_bytes is not None:
+        try:
+            size = get_stat().st_size
+        except OSError:
+            return True  # e.g. broken symlink: let the pipeline report the error
+        if size > max_size_bytes:
+            stats.skipped[f"File too large (>{max_size_bytes // (1024 * 1024)}MB)"] += 1
+            if DEV_MODE:
+                logging.debug("Skipped oversized file: %s", path)
+            return False
+
+    return True
+
+def _scan_directory(
+    directory: str,
+    matcher: IgnoreMatcher,
+    max_size_bytes: Optional[int],
+) -> tuple[List[tuple[str, IgnoreMatcher]], List[str], ScanStats]:
+    """
+    List one directory: (subdirectories to descend into, each with its
+    matcher, accepted files, stats). Only touches local state, so
+    directories can be listed concurrently. Symlinked directories are not
+    followed, as with os.walk; ignored ones are pruned without listing them.
+    """
+    subdirectories: List[tuple[str, IgnoreMatcher]] = []
+    accepted: List[str] = []
+    stats = ScanStats()
+    try:
+        with os.scandir(directory) as iterator:
+            entries = list(iterator)
+    except OSError as error:
+        matcher.events.record("unlistable directory", logging.DEBUG, "Cannot list directory %s: %s", directory, error)
+        return subdirectories, accepted, stats
+
+    matcher = matcher.for_directory(directory, {entry.name for entry in entries})
+    for entry in entries:
+        try:
+            is_directory = entry.is_dir()
+        except OSError:
+            is_directory = False
+        if is_directory:
+            if entry.name in EXCLUDED_DIRECTORIES or entry.is_symlink():
+                continue
+            if matcher.is_ignored(entry.path, True):
+                stats.pruned_directories += 1
+                if DEV_MODE:
+                    logging.debug("Pruned ignored directory: %s", entry.path)
+                continue
+            subdirectories.append((entry.path, matcher))
+            continue
+
+        stats.directories.add(directory)
+        if matcher.is_ignored(entry.path, False):
+            stats.skipped[REASON_IGNORED] += 1
+        elif not matcher.is_included(entry.path):
+            stats.skipped[REASON_NOT_INCLUDED] += 1
+        elif _accept_file(entry.name, entry.path, entry.stat, max_size_bytes, stats, matcher.events):
+            accepted.append(entry.path)
+    return subdirectories, accepted, stats
+
+def _walk_directories(
+    roots: List[tuple[str, IgnoreMatcher]],
+    max_size_bytes: Optional[int],
+    stats: ScanStats,
+    collected: Set[str],
+    workers: int = 1,
+) -> None:
+    """
+    Walk every (root, matcher). With workers > 1 directories are listed on
+    a thread pool (at most workers * WORKER_QUEUE_DEPTH listings in flight),
+    which hides per-directory latency on network shares. Results are merged
+    on the calling thread; the caller sorts them, so the order is deterministic.
+    """
+    pending = list(roots)
+
+    if workers <= 1:
+        while pending:
+            subdirectories, accepted, directory_stats = _scan_directory(*pending.pop(), max_size_bytes)
+            pending.extend(subdirectories)
+            collected.update(accepted)
+            stats.merge(directory_stats)
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+    in_flight_limit = workers * WORKER_QUEUE_DEPTH
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{APP_NAME}-walk") as executor:
+        running: Set[Future] = set()
+        while pending or running:
+            while pending and len(running) < in_flight_limit:
+                running.add(executor.submit(_scan_directory, *pending.pop(), max_size_bytes))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirectories, accepted, directory_stats = future.result()
+                pending.extend(subdirectories)
+                collected.update(accepted)
+                stats.merge(directory_stats)
+
+def expand_input_paths(
+    arguments: Iterable[str],
+    max_size_bytes: Optional[int] = None,
+    scan_stats: Optional[ScanStats] = None,
+    workers: int = 1,
+    include: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+    read_ignore_files: bool = True,
+    events: FileEvents = FILE_EVENTS,
+) -> List[Path]:
+    """
+    Collect the files to merge, sorted. Directories are walked with
+    os.scandir, on `workers` threads; unsupported files, and files over
+    max_size_bytes (checked with the DirEntry stat), are pruned during the
+    walk and only counted in scan_stats.
+
+    Inside directories, .gitignore/.ignore files (unless read_ignore_files
+    is False) and the gitignore-style `exclude` globs prune files and whole
+    directories; with `include` globs only matching files are kept.
+    Explicitly selected files are always kept.
+    """
+    include = list(include)
+    exclude = list(exclude)
+    stats = scan_stats if scan_stats is not None else ScanStats()
+    collected_files: Set[str] = set()
+    directory_roots: List[tuple[str, IgnoreMatcher]] = []
+
+    for argument in arguments:
+        sanitized = sanitize_argument(argument)
+        if not sanitized:
+            continue
+
+        path = Path(sanitized).expanduser().resolve()
+
+        if not path.exists():
+            logging.debug("Path not found: %s", path)
+            continue
+
+        if path.is_file():
+            stats.directories.add(str(path.parent))
+            if _accept_file(path.name, str(path), path.stat, max_size_bytes, stats, events):
+                collected_files.add(str(path))
+            continue
+
+        if path.is_dir():
+            root = str(path)
+            directory_roots.append(
+                (root, IgnoreMatcher.for_root(root, include, exclude, read_ignore_files, events))
+            )
+
+    _walk_directories(directory_roots, max_size_bytes, stats, collected_files, workers)
+
+    # Paths sort by components, not by string: keep that order
+    return sorted(map(Path, collected_files))
+
+# =========================
+# Duplicati (hard link, symlink, contenuto identico)
+# =========================
+
+@dataclass
+class Duplicates:
+    """Selected files identical to an earlier one: merged once, then referenced."""
+    originals: dict[Path, Path] = field(default_factory=dict)  # duplicate -> first occurrence
+    same_inode: int = 0  # Found by (st_dev, st_ino): hard links and symlinks, nothing read
+    bytes_hashed: int = 0
+
+def _stat_or_none(path: Path) -> Optional[os.stat_result]:
+    try:
+        return path.stat()
+    except OSError:
+        return None
+
+def _content_digest(path: Path, counters: IoCounters) -> Optional[bytes]:
+    """BLAKE2b of the file, read in STREAM_CHUNK_SIZE chunks; None if unreadable."""
+    import hashlib
+
+    digest = hashlib.blake2b(digest_size=16)
+    buffer = bytearray(STREAM_CHUNK_SIZE)
+    view = memoryview(buffer)
+    reads = size = 0
+    try:
+        with open_input_file(path, counters) as file:
+            while True:
+                length = file.readinto(buffer)
+                reads += 1
+                if not length:
+                    break
+                digest.update(view[:length])
+                size += length
+    except OSError:
+        return None
+    finally:
+        counters.add(reads=reads, bytes_read=size)
+    return digest.digest()
+
+def _map_on_threads(function: Callable, items: List, workers: int) -> List:
+    if workers <= 1 or len(items) < 2:
+        return list(map(function, items))
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{APP_NAME}-dedupe") as executor:
+        return list(executor.map(function, items))
+
+def find_duplicates(files: List[Path], workers: int = 1, counters: IoCounters = IO_COUNTERS) -> Duplicates:
+    """
+    Map each file identical to an earlier one in files (output order) to
+    that first occurrence. Hard links and symlinks to one file collapse by
+    (st_dev, st_ino) without reads; only files sharing their size with
+    another one are hashed. Files under DEDUPE_MIN_BYTES are left alone.
+    """
+    duplicates = Duplicates()
+    by_inode: dict[tuple[int, int], Path] = {}
+    by_size: dict[int, List[Path]] = {}
+    for path, stat in zip(files, _map_on_threads(_stat_or_none, files, workers)):
+        if stat is None or stat.st_size < DEDUPE_MIN_BYTES:
+            continue
+        first = by_inode.setdefault((stat.st_dev, stat.st_ino), path)
+        if first is not path:
+            duplicates.originals[path] = first
+            duplicates.same_inode += 1
+        else:
+            by_size.setdefault(stat.st_size, []).append(path)
+
+    candidates = [path for group in by_size.values() if len(group) > 1 for path in group]
+    before = counters.bytes_read
+    digests = _map_on_threads(partial(_content_digest, counters=counters), candidates, workers)
+    duplicates.bytes_hashed = counters.bytes_read - before
+    by_content: dict[bytes, Path] = {}
+    for path, digest in zip(candidates, digests):
+        if digest is None:
+            continue  # Unreadable: the pipeline reports it
+        first = by_content.setdefault(digest, path)
+        if first is not path:
+            duplicates.originals[path] = first
+
+    # A hard link of a file that is itself a copy points to the first copy
+    for path, first in duplicates.originals.items():
+        duplicates.originals[path] = duplicates.originals.get(first, first)
+    return duplicates
+
+def section_name(file_path: Path, base_directory: Path) -> str:
+    """Name of file_path in its "=== name ===" header."""
+    if file_path.is_relative_to(base_directory):
+        return str(file_path.relative_to(base_directory))
+    return file_path.name
+
+# =========================
+# Elaborazione file (pipeline)
+# =========================
+
+@dataclass
+class FileResult:
+    """Outcome of the per-file pipeline: text to merge, or the exclusion reason."""
+    path: Path
+    relative_name: str
+    content: Optional[str] = None
+    reason: Optional[str] = None
+    encoding: Optional[str] = None
+    source: Optional[BinaryIO] = None  # Large files: opened, streamed by the writer
+    raw: Optional[memoryview] = None  # Clean UTF-8, written as-is (already trimmed)
+    copy_length: Optional[int] = None  # Clean large file: bytes of source to copy
+    previous_section: Optional[tuple[int, int]] = None  # --incremental: (offset, length) to reuse
+    section_estimate: Optional[tuple[int, int]] = None  # (bytes, tokens), see prepare_section_size()
+    duplicate_of: Optional[str] = None  # Name of the identical file merged earlier (never read)
+    phase_seconds: dict[str, float] = field(default_factory=dict)  # read/detect/decode/extract
+
+    @property
+    def included(self) -> bool:
+        return self.reason is None
+
+def process_file(
+    file_path: Path,
+    base_directory: Path,
+    max_size_bytes: int,
+    max_size_mb: int,
+    pdf_extractor: Optional[PdfExtractor] = None,
+    cache: Optional[ExtractionCache] = None,
+    counters: IoCounters = IO_COUNTERS,
+    mmap_threshold: Optional[int] = MMAP_THRESHOLD_BYTES,
+    events: FileEvents = FILE_EVENTS,
+) -> FileResult:
+    """
+    Filter, detect and decode one file.
+    Never touches the output file, so it is safe to run on worker threads.
+    With a cache, a file whose (size, mtime) is unchanged skips detection
+    (and PDF extraction) and reuses the recorded verdict and encoding.
+    The time spent is recorded in result.phase_seconds: PDFs count as
+    "extract"; for other files "read" and "decode" are measured and the
+    rest (open, stat, cache lookup, detection) counts as "detect".
+    """
+    started = time.perf_counter()
+    result = _process_file(
+        file_path, base_directory, max_size_bytes, max_size_mb, pdf_extractor, cache, counters, mmap_threshold, events
+    )
+    elapsed = time.perf_counter() - started
+    phases = result.phase_seconds
+    if file_path.suffix.lower() == ".pdf":
+        phases["extract"] = elapsed
+    else:
+        phases["detect"] = max(0.0, elapsed - phases.get("read", 0.0) - phases.get("decode", 0.0))
+    return result
+
+def _process_file(
+    file_path: Path,
+    base_directory: Path,
+    max_size_bytes: int,
+    max_size_mb: int,
+    pdf_extractor: Optional[PdfExtractor],
+    cache: Optional[ExtractionCache],
+    counters: IoCounters,
+    mmap_threshold: Optional[int] = MMAP_THRESHOLD_BYTES,
+    events: FileEvents = FILE_EVENTS,
+) -> FileResult:
+    relative_name = file_path.name
+    try:
+        if file_path.is_relative_to(base_directory):
+            relative_name = str(file_path.relative_to(base_directory))
+
+        # expand_input_paths already pruned these; kept for direct callers
+        if not is_supported_file(file_path):
+            if is_previous_output_name(file_path.name):
+                return FileResult(file_path, relative_name, reason=REASON_PREVIOUS_OUTPUT)
+            return FileResult(file_path, relative_name, reason=REASON_UNSUPPORTED)
+
+        # Special handling for PDF files (skip binary detection)
+        if file_path.suffix.lower() == '.pdf':
+            pdf_stat = file_path.stat() if cache is not None else None
+            cached = cache.get(file_path, pdf_stat) if cache is not None else None
+            if cached is not None and cached.text is not None:
+                return FileResult(file_path, relative_name, content=cached.text, encoding="pdf")
+            time_cap = pdf_extractor.time_cap if pdf_extractor is not None else 0
+            # A time-capped verdict only holds for the same cap
+            if cached is not None and cached.reason is not None and (
+                not is_pdf_time_cap_reason(cached.reason) or cached.reason == pdf_time_cap_reason(time_cap)
+            ):
+                return FileResult(file_path, relative_name, reason=cached.reason)
+
+            if pdf_extractor is not None:
+                content, reason = pdf_extractor.extract(file_path, events)
+            else:
+                content = extract_pdf_text(file_path, events)
+                reason = PDF_FAILED_REASON
+            if content is None:
+                if DEV_MODE:
+                    logging.debug("PDF unreadable: %s", relative_name)
+                # Image-only, encrypted, unreadable or capped: not extracted again while unchanged
+                if cache is not None and pdf_support_available():
+                    cache.put(file_path, pdf_stat, CacheEntry(reason=reason))
+                return FileResult(file_path, relative_name, reason=reason)
+            if cache is not None:
+                cache.put(file_path, pdf_stat, CacheEntry(encoding="pdf", text=content))
+            return FileResult(file_path, relative_name, content=content, encoding="pdf")
+
+        # The size comes from fstat on the open file: no separate stat() call
+        source = open_input_file(file_path, counters)
+        try:
+            file_stat = os.fstat(source.fileno())
+            file_size = file_stat.st_size
+            if file_size > max_size_bytes:
+                source.close()
+                if DEV_MODE:
+                    logging.debug("Skipped oversized file: %s", relative_name)
+                return FileResult(file_path, relative_name, reason=f"File too large (>{max_size_mb}MB)")
+
+            cached = cache.get(file_path, file_stat) if cache is not None else None
+            if cached is not None and cached.reason is not None:
+                source.close()
+                return FileResult(file_path, relative_name, reason=cached.reason)
+
+            if file_size >= STREAMING_THRESHOLD_BYTES:
+                if cached is not None:
+                    return FileResult(
+                        file_path,
+                        relative_name,
+                        encoding=cached.encoding,
+                        source=source,
+                        copy_length=cached.copy_length,
+                    )
+                result = _detect_streamed_file(source, file_path, relative_name, counters, file_size, mmap_threshold)
+                if cache is not None and result.reason is None:
+                    cache.put(file_path, file_stat, CacheEntry(
+                        encoding=result.encoding,
+                        passthrough=result.copy_length is not None,
+                        copy_length=result.copy_length,
+                    ))
+                elif cache is not None:
+                    cache.put(file_path, file_stat, CacheEntry(reason=result.reason))
+                return result
+
+            # Standard text file handling: one read, detection and decoding in memory
+            read_started = time.perf_counter()
+            with source:
+                data = read_open_file(source, file_size, counters)
+            read_seconds = time.perf_counter() - read_started
+        except BaseException:
+            source.close()
+            raise
+
+        result = None
+        if cached is not None:
+            decode_started = time.perf_counter()
+            if cached.passthrough:
+                raw = memoryview(data)[:utf8_rstrip_length(data)]
+                result = FileResult(file_path, relative_name, raw=raw, encoding=cached.encoding)
+            else:
+                content, encoding = decode_text_bytes(data, cached.encoding)
+                if content is not None:
+                    result = FileResult(file_path, relative_name, content=content, encoding=encoding)
+            if result is not None:
+                result.phase_seconds["decode"] = time.perf_counter() - decode_started
+
+        if result is None:
+            result = _detect_text_data(data, file_path, relative_name)
+            if cache is not None:
+                cache.put(file_path, file_stat, CacheEntry(
+                    reason=result.reason,
+                    encoding=result.encoding,
+                    passthrough=result.raw is not None,
+                ))
+        result.phase_seconds["read"] = read_seconds
+        return result
+
+    except Exception as exception:
+        events.record(
+            f"error reading ({type(exception).__name__})",
+            logging.ERROR,
+            "Error processing file %s: %s",
+            file_path,
+            exception,
+            exc_info=True,
+        )
+        return FileResult(file_path, relative_name, reason=f"Error: {exception}")
+
+def _detect_text_data(data: bytes, file_path: Path, relative_name: str) -> FileResult:
+    """Detect and decode a file read whole."""
+    encoding = sniff_encoding(data[:ENCODING_SNIFF_SIZE])
+    if not is_probably_text_content(data, lambda offset, length: data[offset:offset + length], len(data), encoding):
+        if DEV_MODE:
+            logging.debug("Skipped binary-like file: %s", relative_name)
+        return FileResult(file_path, relative_name, reason="Binary file detected")
+
+    decode_started = time.perf_counter()
+    clean_encoding = passthrough_encoding(data, encoding)
+    if clean_encoding is not None:
+        raw = memoryview(data)[:utf8_rstrip_length(data)]
+        result = FileResult(file_path, relative_name, raw=raw, encoding=clean_encoding)
+    else:
+        content, encoding = decode_text_bytes(data, encoding)
+        if content is None:
+            if DEV_MODE:
+                logging.debug("Unreadable file: %s", relative_name)
+            result = FileResult(file_path, relative_name, reason="Encoding not supported")
+        else:
+            result = FileResult(file_path, relative_name, content=content, encoding=encoding)
+
+    result.phase_seconds["decode"] = time.perf_counter() - decode_started
+    return result
+
+def _detect_streamed_file(
+    source: BinaryIO,
+    file_path: Path,
+    relative_name: str,
+    counters: IoCounters = IO_COUNTERS,
+    size: int = 0,
+    mmap_threshold: Optional[int] = None,
+) -> FileResult:
+    """
+    Detect a large file from its prefix and samples (is_probably_text_content)
+    and hand the open file to the writer, which copies it in chunks instead
+    of loading it whole.
+    Clean UTF-8 is verified here, off the writer thread, so the writer can
+    copy it without decoding. Takes ownership of source.
+    From mmap_threshold bytes the file is mapped instead (_detect_mapped_file).
+    """
+    try:
+        if mmap_threshold is not None and size >= mmap_threshold:
+            mapping = map_input_file(source, size, counters)
+            if mapping is not None:
+                with mapping:
+                    return _detect_mapped_file(mapping, size, source, file_path, relative_name, counters)
+
+        prefix = source.read(ENCODING_SNIFF_SIZE)
+        counters.add(reads=1, bytes_read=len(prefix))
+        encoding = sniff_encoding(prefix)
+
+        def read_at(offset: int, length: int) -> bytes:
+            source.seek(offset)
+            sample = source.read(length)
+            counters.add(reads=1, bytes_read=len(sample))
+            return sample
+
+        if not is_probably_text_content(prefix, read_at, size or os.fstat(source.fileno()).st_size, encoding):
+            source.close()
+            if DEV_MODE:
+                logging.debug("Skipped binary-like file: %s", relative_name)
+            return FileResult(file_path, relative_name, reason="Binary file detected")
+
+        if encoding in ("ascii", "utf-8"):
+            clean = scan_passthrough_length(source, counters)
+            if clean is not None:
+                copy_length, encoding = clean
+                return FileResult(
+                    file_path,
+                    relative_name,
+                    encoding=encoding,
+                    source=source,
+                    copy_length=copy_length,
+                )
+    except BaseException:
+        source.close()
+        raise
+    return FileResult(file_path, relative_name, encoding=encoding, source=source)
+
+def _detect_mapped_file(
+    mapping,
+    size: int,
+    source: BinaryIO,
+    file_path: Path,
+    relative_name: str,
+    counters: IoCounters,
+) -> FileResult:
+    """
+    _detect_streamed_file() on a mapping: the binary check samples the
+    mapping, passthrough validation runs on the mapped pages.
+    """
+    head = mapping[:ENCODING_SNIFF_SIZE]
+    encoding = sniff_encoding(head)
+    counters.add(bytes_read=len(head))
+    if not is_probably_text_content(head, lambda offset, length: mapping[offset:offset + length], size, encoding):
+        source.close()
+        if DEV_MODE:
+            logging.debug("Skipped binary-like file: %s", relative_name)
+        return FileResult(file_path, relative_name, reason="Binary file detected")
+
+    if encoding in ("ascii", "utf-8"):
+        clean = scan_mapped_passthrough(mapping, size, counters)
+        if clean is not None:
+            copy_length, encoding = clean
+            return FileResult(file_path, relative_name, encoding=encoding, source=source, copy_length=copy_length)
+    return FileResult(file_path, relative_name, encoding=encoding, source=source)
+
+def iter_file_results(
+    files: List[Path],
+    worker: Callable[[Path], FileResult],
+    workers: int = DEFAULT_WORKERS,
+) -> Iterator[FileResult]:
+    """
+    Yield one FileResult per input file, always in input order.
+
+    With workers > 1 the worker runs on a thread pool; at most
+    workers * WORKER_QUEUE_DEPTH files are in flight, so a slow file
+    only holds back the writer and memory stays bounded. Closing the
+    generator early closes the sources of the results read ahead.
+    """
+    if workers <= 1:
+        for file_path in files:
+            yield worker(file_path)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    remaining = iter(files)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=APP_NAME) as executor:
+        pending = deque(
+            executor.submit(worker, file_path)
+            for file_path in islice(remaining, workers * WORKER_QUEUE_DEPTH)
+        )
+        try:
+            while pending:
+                result = pending.popleft().result()
+                next_file = next(remaining, None)
+                if next_file is not None:
+                    pending.append(executor.submit(worker, next_file))
+                yield result
+        finally:
+            # Closed early (--budget-policy stop): release the files read ahead
+            for future in pending:
+                if future.cancel() or future.exception() is not None:
+                    continue
+                if future.result().source is not None:
+                    future.result().source.close()
+
+# =========================
+# Export incrementale
+# =========================
+
+def manifest_path(output_file: Path) -> Path:
+    return output_file.with_name(output_file.name + MANIFEST_SUFFIX)
+
+def manifest_temporary_path(output_file: Path) -> Path:
+    """Written next to the manifest (same file system) and renamed over it."""
+    target = manifest_path(output_file)
+    return target.with_name(target.name + ".tmp")
+
+def find_previous_manifest(output_directory: Path, folder_name: str) -> Optional[Path]:
+    """Manifest of the latest timestamped output-<folder>-*.txt, if any."""
+    candidates = sorted(output_directory.glob(f"output-{folder_name}-*.txt{MANIFEST_SUFFIX}"))
+    return candidates[-1] if candidates else None
+
+class IncrementalExport:
+    """
+    --incremental: reuse the sections of the previous output.
+
+    The manifest written next to each output records the export settings,
+    a fingerprint of the selected tree and, for every merged file, its
+    size, mtime and the byte range of its section in the output. Files
+    whose size and mtime still match are copied from the previous output
+    instead of being read again; if the whole fingerprint matches there is
+    nothing to do.
+    """
+
+    def __init__(
+        self,
+        previous_manifest: Optional[Path],
+        settings: dict,
+        files: List[Path],
+        scan_stats: ScanStats,
+    ):
+        self.settings = settings
+        self.file_stats: dict[str, os.stat_result] = {}
+        for file_path in files:
+            try:
+                self.file_stats[str(file_path)] = file_path.stat()
+            except OSError:
+                pass  # Reported by the pipeline
+        self.fingerprint = self._fingerprint(scan_stats)
+        # A file that may still change without its (size, mtime) changing
+        # is never reused, and makes the next run check every file
+        now = time.time_ns()
+        self._racy = {key for key, stat in self.file_stats.items() if now - stat.st_mtime_ns < RACY_MTIME_WINDOW_NS}
+        self.previous_output: Optional[Path] = None
+        self.unchanged = False
+        self.reused = 0
+        self.sections: dict[str, dict] = {}  # Sections written by this run
+        self._previous_sections: dict[str, dict] = {}
+        self._previous_file: Optional[BinaryIO] = None
+        if previous_manifest is not None:
+            self._load(previous_manifest)
+
+    def _fingerprint(self, scan_stats: ScanStats) -> str:
+        import hashlib
+        import json
+
+        digest = hashlib.sha256(json.dumps(self.settings, sort_keys=True).encode("utf-8"))
+        for key, stat in sorted(self.file_stats.items()):
+            digest.update(f"{key}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+        # Pruned files only appear in the summary as counts
+        for reason, count in sorted(scan_stats.skipped.items()):
+            digest.update(f"{reason}\0{count}\n".encode("utf-8"))
+        digest.update(str(scan_stats.pruned_directories).encode("ascii"))
+        return digest.hexdigest()
+
+    def _load(self, path: Path) -> None:
+        import json
+
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+            if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != self.settings:
+                logging.info("Incremental: settings changed since %s, full export", path)
+                return
+            output = path.with_name(manifest["output"])
+            output_stat = output.stat()
+            if (output_stat.st_size, output_stat.st_mtime_ns) != (manifest["output_size"], manifest["output_mtime_ns"]):
+                logging.info("Incremental: %s was modified, full export", output)
+                return
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.info("Incremental: previous manifest unusable (%s), full export", error)
+            return
+
+        self.previous_output = output
+        if manifest.get("fingerprint") == self.fingerprint:
+            self.unchanged = True
+            return
+        self._previous_sections = manifest.get("sections", {})
+        self._previous_file = open(output, "rb")
+
+    def process(self, file_path: Path, worker: Callable[[Path], FileResult]) -> FileResult:
+        """Reuse the previous section of an unchanged file, or run worker."""
+        key = str(file_path)
+        previous = self._previous_sections.get(key)
+        stat = self.file_stats.get(key)
+        if (
+            previous is not None
+            and stat is not None
+            and (previous["size"], previous["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns)
+        ):
+            return FileResult(
+                file_path,
+                previous["name"],
+                encoding=previous["encoding"],
+                previous_section=(previous["offset"], previous["length"]),
+                section_estimate=(previous["length"], previous["tokens"]),
+            )
+        return worker(file_path)
+
+    def copy_previous_section(self, writer: OutputWriter, result: FileResult) -> None:
+        offset, length = result.previous_section
+        writer.copy_section(self._previous_file, offset, length)
+        self.reused += 1
+
+    def record(self, result: FileResult, encoding: str, offset: int, length: int, tokens: int) -> None:
+        """Remember a written section; tokens is its estimate (0 without --token-budget)."""
+        key = str(result.path)
+        stat = self.file_stats.get(key)
+        if stat is None or key in self._racy:
+            return
+        self.sections[key] = {
+            "name": result.relative_name,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "encoding": encoding,
+            "offset": offset,
+            "length": length,
+            "tokens": tokens,
+        }
+
+    def close(self) -> None:
+        if self._previous_file is not None:
+            self._previous_file.close()
+            self._previous_file = None
+
+    def write_manifest(self, output_file: Path) -> None:
+        import json
+
+        output_stat = output_file.stat()
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "fingerprint": None if self._racy else self.fingerprint,
+            "output": output_file.name,
+            "output_size": output_stat.st_size,
+            "output_mtime_ns": output_stat.st_mtime_ns,
+            "sections": self.sections,
+        }
+        target = manifest_path(output_file)
+        temporary = manifest_temporary_path(output_file)
+        temporary.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(temporary, target)
+
+# =========================
+# Modalità watch
+# =========================
+
+def _is_watched_path(path: str, is_directory: bool, matcher: Optional[IgnoreMatcher]) -> bool:
+    """
+    False for what the walk (_scan_directory) would prune or leave out, so
+    its changes cannot affect the output. Ignore files always count.
+    matcher is the one in effect in the path's directory (None = no rules).
+    """
+    name = os.path.basename(path)
+    if matcher is None or name in IGNORE_FILE_NAMES:
+        return True
+    if is_directory:
+        return name not in EXCLUDED_DIRECTORIES and not matcher.is_ignored(path, True)
+    return not matcher.is_ignored(path, False) and matcher.is_included(path)
+
+def _list_watched_directory(
+    directory: str,
+    matcher: Optional[IgnoreMatcher],
+) -> tuple[Optional[IgnoreMatcher], List[os.DirEntry], List[tuple[str, IgnoreMatcher]]]:
+    """
+    List a watched directory: (matcher in effect in it, entries that can
+    affect the output, subdirectories to watch with their matcher).
+    matcher None watches the directory itself only, every entry included.
+    """
+    with os.scandir(directory) as iterator:
+        entries = list(iterator)
+    if matcher is None:
+        return None, entries, []
+    matcher = matcher.for_directory(directory, {entry.name for entry in entries})
+    watched: List[os.DirEntry] = []
+    subdirectories: List[tuple[str, IgnoreMatcher]] = []
+    for entry in entries:
+        try:
+            is_directory = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            continue
+        if not _is_watched_path(entry.path, is_directory, matcher):
+            continue
+        watched.append(entry)
+        if is_directory:
+            subdirectories.append((entry.path, matcher))
+    return matcher, watched, subdirectories
+
+class PollingWatcher:
+    """
+    Change detection by comparing (size, mtime) snapshots of the watched
+    trees. Used where inotify is not available (Windows, network shares).
+    Directories and files the walk would prune (ignore files, --exclude,
+    --include) are not watched.
+    """
+
+    def __init__(self, roots: List[tuple[str, Optional[IgnoreMatcher]]], interval: float = WATCH_POLL_INTERVAL_SECONDS):
+        self.roots = roots  # (directory, matcher of its tree; None = the directory only)
+        self.interval = interval
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> dict[str, tuple[int, int]]:
+        snapshot: dict[str, tuple[int, int]] = {}
+        pending = list(self.roots)
+        while pending:
+            directory, matcher = pending.pop()
+            try:
+                _, entries, subdirectories = _list_watched_directory(directory, matcher)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        continue  # Added and removed files show up by themselves
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            pending.extend(subdirectories)
+        return snapshot
+
+    def read_changes(self, timeout: Optional[float]) -> Set[str]:
+        time.sleep(self.interval if timeout is None else timeout)
+        previous, self._snapshot = self._snapshot, self._take_snapshot()
+        return {
+            path
+            for path in previous.keys() | self._snapshot.keys()
+            if previous.get(path) != self._snapshot.get(path)
+        }
+
+    def wait_for_changes(self, debounce: float = WATCH_DEBOUNCE_SECONDS) -> Set[str]:
+        """Block until something changes, then until debounce seconds pass quietly."""
+        changed = self.read_changes(None)
+        while not changed:
+            changed = self.read_changes(None)
+        while True:
+            more = self.read_changes(debounce)
+            if not more:
+                return changed
+            changed |= more
+
+    def close(self) -> None:
+        pass
+
+class InotifyWatcher(PollingWatcher):
+    """Linux: inotify through ctypes, one watch per directory."""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    )
+
+    def __init__(self, roots: List[tuple[str, Optional[IgnoreMatcher]]]):
+        import ctypes
+        import ctypes.util
+        self.roots = roots
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> (directory, matcher in effect in it)
+        self._directories: dict[int, tuple[str, Optional[IgnoreMatcher]]] = {}
+        try:
+            for directory, matcher in roots:
+                self._add_watches(directory, matcher)
+        except BaseException:
+            self.close()
+            raise
+
+    def _add_watches(self, directory: str, matcher: Optional[IgnoreMatcher]) -> None:
+        import ctypes
+        pending = [(directory, matcher)]
+        while pending:
+            current, current_matcher = pending.pop()
+            descriptor = self._libc.inotify_add_watch(self._fd, os.fsencode(current), self.WATCH_MASK)
+            if descriptor < 0:
+                error = ctypes.get_errno()
+                if current == directory:
+                    raise OSError(error, f"inotify_add_watch failed: {os.strerror(error)}", current)
+                logging.debug("Not watching %s: %s", current, os.strerror(error))
+                continue
+            try:
+                current_matcher, _, subdirectories = _list_watched_directory(current, current_matcher)
+            except OSError:
+                subdirectories = []
+            self._directories[descriptor] = (current, current_matcher)
+            pending.extend(subdirectories)
+
+    def read_changes(self, timeout: Optional[float]) -> Set[str]:
+        import select
+        import struct
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return set()
+
+        changed: Set[str] = set()
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _cookie, length = struct.unpack_from("iIII", data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0"))
+            offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost: report the roots, which forces a rescan
+                changed.update(directory for directory, _ in self.roots)
+                continue
+            watched = self._directories.get(descriptor)
+            if watched is None:
+                continue
+            directory, matcher = watched
+            if not name:
+                changed.add(directory)
+                continue
+            path = os.path.join(directory, name)
+            is_directory = bool(mask & self.IN_ISDIR)
+            if not _is_watched_path(path, is_directory, matcher):
+                continue
+            changed.add(path)
+            if matcher is not None and is_directory and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self._add_watches(path, matcher)
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+def open_watcher(roots: List[tuple[str, Optional[IgnoreMatcher]]]) -> PollingWatcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as error:
+            logging.warning("inotify unavailable (%s), polling every %gs", error, WATCH_POLL_INTERVAL_SECONDS)
+    return PollingWatcher(roots)
+
+def _selection_still_valid(changed: Set[str], selected: Set[str], max_size_bytes: int) -> bool:
+    """
+    True when every change is an edit of an already selected file, so the
+    previous walk still holds. Anything else (new, deleted or renamed
+    files, ignore files) needs a new walk.
+    """
+    for path in changed:
+        if path not in selected or os.path.basename(path) in IGNORE_FILE_NAMES:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size > max_size_bytes:
+            return False
+    return True
+
+def _is_own_file(path: str, own_files: Set[str]) -> bool:
+    """Paths --watch must not react to: its own writes and any output-*.txt (manifests included)."""
+    if path in own_files:
+        return True
+    name = os.path.basename(path)
+    return is_previous_output_name(name) or is_previous_output_name(name.removesuffix(".tmp"))
+
+def watch(args: argparse.Namespace) -> int:
+    """
+    --watch: export once, then refresh the same output after every burst
+    of changes. Refreshes are incremental (unchanged sections are copied
+    from the previous output) and reuse the previous walk when only
+    already selected files were edited.
+    """
+    if args.output is None:
+        output_directory, folder_name = default_output_location(args.paths)
+        args.output = output_directory / f"output-{folder_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+    args.incremental = True
+    output_file = args.output.resolve()
+    # Everything a refresh writes: output, manifest and its temporary file
+    own_files = {str(output_file), str(manifest_path(output_file)), str(manifest_temporary_path(output_file))}
+    max_size_bytes = args.max_size_mb * 1024 * 1024
+
+    options = MergeOptions.from_arguments(args)
+    # Directories are watched with the rules of the walk; explicitly selected files always count
+    roots: List[tuple[str, Optional[IgnoreMatcher]]] = []
+    for argument in args.paths:
+        sanitized = sanitize_argument(argument)
+        if not sanitized:
+            continue
+        path = Path(sanitized).expanduser().resolve()
+        if path.is_dir():
+            matcher = IgnoreMatcher.for_root(str(path), options.include, options.exclude, options.read_ignore_files)
+            roots.append((str(path), matcher))
+        elif path.parent.is_dir():
+            roots.append((str(path.parent), None))
+
+    selection = select_files(args.paths, options)
+    run_export(args, selection, notify=False)
+
+    watcher = open_watcher(roots)
+    logging.info("Watching %d location(s) with %s", len(roots), type(watcher).__name__)
+    try:
+        while True:
+            changed = {path for path in watcher.wait_for_changes() if not _is_own_file(path, own_files)}
+            if not changed:
+                continue
+            started = time.perf_counter()
+            if any(os.path.basename(path) in IGNORE_FILE_NAMES for path in changed):
+                # The watched directories follow the ignore rules: watch them anew
+                watcher.close()
+                watcher = open_watcher(roots)
+            selected = {str(file_path) for file_path in selection[0]}
+            if not _selection_still_valid(changed, selected, max_size_bytes):
+                selection = select_files(args.paths, options)
+            run_export(args, selection, notify=False)
+            logging.info(
+                "Watch: %d change(s), output refreshed in %.0f ms",
+                len(changed),
+                (time.perf_counter() - started) * 1000,
+            )
+    except KeyboardInterrupt:
+        logging.info("Watch stopped")
+    finally:
+        watcher.close()
+    return EXIT_OK
+
+# =========================
+# Server residente
+# =========================
+
+@dataclass
+class WarmState:
+    """What a resident server keeps alive between exports."""
+    pdf_extractor: PdfExtractor
+    cache: Optional[ExtractionCache] = None
+
+def server_info_path() -> Path:
+    return app_data_directory() / SERVER_FILE_NAME
+
+def _server_address() -> tuple[str, str]:
+    """(address, family) for multiprocessing.connection: a named pipe on Windows."""
+    if sys.platform == "win32":
+        import getpass
+        return rf"\\.\pipe\{APP_NAME}-{getpass.getuser()}", "AF_PIPE"
+    return str(server_info_path().with_name("server.sock")), "AF_UNIX"
+
+def _serve_request(request: dict, warm: WarmState) -> Optional[int]:
+    try:
+        args = parse_arguments(request["argv"])
+    except SystemExit:
+        return None  # Let the client print the usage error
+    if args.watch or args.serve:
+        return None
+
+    cwd = request["cwd"]
+    args.paths = [os.path.join(cwd, sanitize_argument(path)) for path in args.paths if sanitize_argument(path)]
+    if args.output is not None:
+        args.output = Path(cwd) / args.output
+    if args.stats_json is not None:
+        args.stats_json = Path(cwd) / args.stats_json
+    is_valid, _ = validate_selection(args.paths)
+    if not is_valid:
+        return None  # The client shows the error dialog
+
+    logging.info("Server: export requested for %s", args.paths)
+    return run_export(args, warm=warm)
+
+def _handle_connection(connection, warm: WarmState) -> None:
+    with connection:
+        try:
+            request = connection.recv()
+            connection.send({"accepted": True})  # The client stops waiting for a hung server on this
+            try:
+                exit_code = _serve_request(request, warm)
+            except Exception as error:
+                logging.error("Server: export failed: %s", error, exc_info=True)
+                exit_code = EXIT_RUNTIME_ERROR
+            connection.send({"exit_code": exit_code})
+        except (EOFError, OSError) as error:
+            logging.debug("Server: client disconnected: %s", error)
+
+def serve(args: argparse.Namespace) -> int:
+    """
+    --serve: stay resident and run exports forwarded by Folder2Text.forward_to_server(),
+    each on its own thread, sharing a warm PDF process pool and cache.
+    The address and a random key are published in server.json under the
+    app data directory; only clients that can read it can connect.
+    """
+    import json
+    from multiprocessing.connection import Listener
+
+    address, family = _server_address()
+    authkey = os.urandom(32)
+    info_path = server_info_path()
+    info_path.parent.mkdir(parents=True, exist_ok=True)
+    if family == "AF_UNIX" and os.path.exists(address):
+        os.unlink(address)  # Left behind by a server that was killed
+
+    cache = None
+    if not args.no_cache and args.cache_size_mb > 0:
+        cache = ExtractionCache(default_cache_path(), args.cache_size_mb * 1024 * 1024)
+    warm = WarmState(PdfExtractor(args.pdf_workers, time_cap=args.pdf_time_cap), cache)
+
+    with Listener(address, family, authkey=authkey) as listener:
+        descriptor = os.open(info_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w", encoding="utf-8") as info_file:
+            json.dump({"address": address, "family": family, "authkey": authkey.hex(), "pid": os.getpid()}, info_file)
+        logging.info("Server listening on %s", address)
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except OSError as error:  # e.g. a client that failed authentication
+                    logging.warning("Server: connection refused: %s", error)
+                    continue
+                threading.Thread(
+                    target=_handle_connection,
+                    args=(connection, warm),
+                    name=f"{APP_NAME}-request",
+                    daemon=True,
+                ).start()
+        except KeyboardInterrupt:
+            logging.info("Server stopped")
+        finally:
+            info_path.unlink(missing_ok=True)
+            warm.pdf_extractor.close()
+            if cache is not None:
+                cache.close()
+    return EXIT_OK
+
+# =========================
+# Metriche di esecuzione (--stats-json / --profile)
+# =========================
+
+class RunMetrics:
+    """
+    Cost and composition of one export: seconds per phase, the slowest
+    files, I/O totals and output bytes per extension, per top-level folder
+    and per file, for the summary and --stats-json. Filled by the writer
+    loop as sections are written (no second pass), and only by it, so no
+    locking is needed.
+
+    read/detect/decode/extract are summed over the worker threads, so with
+    --workers > 1 they can add up to more than the wall time.
+    """
+
+    PHASES = ("validate", "walk", "dedupe", "read", "detect", "decode", "extract", "write", "move")
+
+    def __init__(self, slowest: int = STATS_SLOWEST_FILES):
+        self.started = time.perf_counter()
+        self.phases: Counter = Counter()
+        self.slowest = slowest
+        self._slowest_heap: List[tuple[float, str]] = []  # Min-heap of (seconds, path)
+        self._largest_heap: List[tuple[int, str]] = []  # Min-heap of (output bytes, relative name)
+        self.bytes_by_extension: Counter = Counter()
+        self.bytes_by_directory: Counter = Counter()  # Top-level folder under the base directory
+        self.io = IoCounters()  # This export's reads, passed down to the readers and the writer
+        self.events = FileEvents()  # This export's per-file events, passed down the same way
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - started
+
+    def add_file(self, result: FileResult, write_seconds: float, output_bytes: int = 0) -> None:
+        """Account one file; output_bytes is the length of its section (0 if excluded)."""
+        self.phases.update(result.phase_seconds)
+        self.phases["write"] += write_seconds
+        _push_bounded(
+            self._slowest_heap,
+            (sum(result.phase_seconds.values()) + write_seconds, str(result.path)),
+            self.slowest,
+        )
+        if output_bytes:
+            parts = Path(result.relative_name).parts
+            self.bytes_by_extension[result.path.suffix.lower() or "(no extension)"] += output_bytes
+            self.bytes_by_directory[parts[0] if len(parts) > 1 else "(base directory)"] += output_bytes
+            _push_bounded(self._largest_heap, (output_bytes, result.relative_name), SUMMARY_TOP_CONTRIBUTORS)
+
+    @property
+    def bytes_read(self) -> int:
+        return self.io.bytes_read
+
+    def slowest_files(self) -> List[tuple[float, str]]:
+        return sorted(self._slowest_heap, reverse=True)
+
+    def largest_files(self) -> List[tuple[int, str]]:
+        return sorted(self._largest_heap, reverse=True)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def write_json(self, path: Path, **totals) -> None:
+        """Write the metrics and the given totals (counts, reasons...) as JSON."""
+        import json
+
+        report = {
+            "app_version": VERSION,
+            "wall_seconds": round(self.elapsed, 4),
+            "phase_seconds": {name: round(self.phases.get(name, 0.0), 4) for name in self.PHASES},
+            "bytes_read": self.bytes_read,
+            **totals,
+            "slowest_files": [
+                {"path": file_path, "seconds": round(seconds, 4)}
+                for seconds, file_path in self.slowest_files()
+            ],
+            "output_bytes_by_extension": dict(self.bytes_by_extension.most_common()),
+            "output_bytes_by_directory": dict(self.bytes_by_directory.most_common()),
+            "largest_files": [
+                {"path": relative_name, "bytes": size}
+                for size, relative_name in self.largest_files()
+            ],
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        logging.info("Run statistics written to: %s", path)
+
+def _push_bounded(heap: list, entry: tuple, limit: int) -> None:
+    """Keep the `limit` largest entries in a min-heap."""
+    import heapq
+
+    if len(heap) < limit:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+def _format_bytes(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024*1024):.2f} MB"
+    if size >= 1024:
+        return f"{size / 1024:.1f} KB"
+    return f"{size} B"
+
+def write_cost_summary(writer: "OutputWriter", metrics: RunMetrics, files_scanned: int, workers: int) -> None:
+    """
+    Summary lines on where the time went and what the output is made of,
+    so oversized contributors can be spotted and excluded. Phases after
+    the summary itself (moving the output in place) are not included.
+    """
+    elapsed = metrics.elapsed
+    timed = [(name, metrics.phases[name]) for name in RunMetrics.PHASES if metrics.phases.get(name)]
+    writer.write_text(f"Elapsed time: {elapsed:.2f} s (" + ", ".join(
+        f"{name} {seconds:.2f} s" for name, seconds in timed
+    ) + ")\n")
+    if workers > 1:
+        writer.write_text(f"  read/detect/decode/extract are summed over {workers} workers\n")
+    if elapsed > 0:
+        writer.write_text(
+            f"Throughput: {files_scanned / elapsed:.0f} files/s, "
+            f"{metrics.bytes_read / (1024*1024) / elapsed:.2f} MB/s read, "
+            f"{writer.written() / (1024*1024) / elapsed:.2f} MB/s written\n"
+        )
+
+    if not metrics.bytes_by_extension:
+        return
+    total = sum(metrics.bytes_by_extension.values())
+    for title, groups in (
+        ("OUTPUT BY EXTENSION", metrics.bytes_by_extension),
+        ("OUTPUT BY TOP-LEVEL FOLDER", metrics.bytes_by_directory),
+    ):
+        writer.write_text(f"\n--- {title} ---\n\n")
+        listed = groups.most_common(SUMMARY_TOP_GROUPS)
+        for name, size in listed:
+            writer.write_text(f"{_format_bytes(size):>10}  {size / total:6.1%}  {name}\n")
+        others = len(groups) - len(listed)
+        if others > 0:
+            rest = total - sum(size for _, size in listed)
+            writer.write_text(f"{_format_bytes(rest):>10}  {rest / total:6.1%}  ({others} more)\n")
+
+    largest = metrics.largest_files()
+    writer.write_text(f"\n--- LARGEST CONTRIBUTORS ({len(largest)}) ---\n\n")
+    for idx, (size, relative_name) in enumerate(largest, 1):
+        writer.write_text(f"{idx:4}. {_format_bytes(size):>10}  {size / total:6.1%}  {relative_name}\n")
+
+def run_profiled(function: Callable[..., int], *args, **kwargs) -> int:
+    """
+    --profile: run function under cProfile and tracemalloc and leave the
+    dumps in the "profiles" folder next to the logs: <stamp>.prof (pstats,
+    snakeviz...), <stamp>.tracemalloc (tracemalloc.Snapshot.load) and
+    <stamp>.txt, a readable top list of both.
+    cProfile only sees the calling thread: use --workers 1 for a full profile.
+    """
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+
+    profile_dir = app_data_directory() / "profiles"
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    stem = profile_dir / f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+
+    profiler = cProfile.Profile()
+    tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    profiler.enable()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(stem.with_suffix(".prof"))
+        snapshot.dump(str(stem.with_suffix(".tracemalloc")))
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(40)
+        report.write(f"\nPeak traced memory: {peak_bytes / (1024*1024):.2f} MB\n")
+        report.write("Top allocations by line:\n")
+        for statistic in snapshot.statistics("lineno")[:25]:
+            report.write(f"  {statistic}\n")
+        stem.with_suffix(".txt").write_text(report.getvalue(), encoding="utf-8")
+        logging.info("Profile written to: %s.{prof,tracemalloc,txt}", stem)
+
+# =========================
+# API di libreria (merge)
+# =========================
+
+@dataclass
+class MergeOptions:
+    """
+    Settings of merge() and iter_sections(); the defaults match the command
+    line, except pdf_workers: a pool spawns processes, which needs an
+    `if __name__ == "__main__":` guard in the calling script.
+    """
+    max_size_mb: int = DEFAULT_MAX_FILE_SIZE_MB
+    workers: int = DEFAULT_WORKERS  # Threads reading and decoding files
+    walk_workers: Optional[int] = None  # Threads listing directories (None = workers)
+    include: Sequence[str] = ()  # gitignore-style globs
+    exclude: Sequence[str] = ()
+    read_ignore_files: bool = True  # Honour .gitignore/.ignore
+    pdf_workers: int = 0  # PDF processes; 0 = extract in the calling process
+    pdf_time_cap: float = DEFAULT_PDF_TIME_CAP_SECONDS
+    cache_size_mb: int = DEFAULT_CACHE_SIZE_MB  # 0 = no extraction cache
+    summary: bool = True  # Append the EXTRACTION SUMMARY
+    output_name: Optional[str] = None  # "Output file:" in the summary (default: the sink's name)
+    token_budget: Optional[int] = None  # Estimated tokens of all sections, summary excluded
+    dedupe: bool = False  # Merge identical files once, reference them afterwards (hashes same-size files)
+    mmap_threshold: Optional[int] = MMAP_THRESHOLD_BYTES  # Map larger inputs; None = always read
+    budget_policy: str = "skip"  # See TokenBudget
+
+    @property
+    def max_size_bytes(self) -> int:
+        return self.max_size_mb * 1024 * 1024
+
+    @classmethod
+    def from_arguments(cls, args: argparse.Namespace) -> "MergeOptions":
+        return cls(
+            max_size_mb=args.max_size_mb,
+            workers=args.workers,
+            walk_workers=args.walk_workers,
+            include=tuple(args.include),
+            exclude=tuple(args.exclude),
+            read_ignore_files=not args.no_ignore,
+            pdf_workers=args.pdf_workers,
+            pdf_time_cap=args.pdf_time_cap,
+            cache_size_mb=0 if args.no_cache else args.cache_size_mb,
+            token_budget=args.token_budget,
+            budget_policy=args.budget_policy,
+            dedupe=args.dedupe,
+            mmap_threshold=None if args.no_mmap else MMAP_THRESHOLD_BYTES,
+        )
+
+@dataclass
+class FileRecord:
+    """What a merge did with one selected file."""
+    path: Path
+    relative_name: str
+    encoding: Optional[str] = None
+    reason: Optional[str] = None  # Why the file was excluded; None = included
+    output_offset: int = 0  # Included files: where their section starts in the output
+    output_bytes: int = 0  # ... and its length
+    tokens: int = 0  # Estimated tokens of the section (only computed with a token budget)
+    duplicate_of: Optional[Path] = None  # Written as a reference to this identical file
+
+    @property
+    def included(self) -> bool:
+        return self.reason is None
+
+@dataclass
+class Section:
+    """One file as yielded by iter_sections(): its record and its bytes in the output."""
+    record: FileRecord
+    data: bytes = b""
+
+@dataclass
+class MergeResult:
+    """Outcome of merge(): one record per selected file, in output order."""
+    files: List[FileRecord]
+    scan_stats: ScanStats  # Files pruned during the walk: counts only
+    base_directory: Path
+    metrics: RunMetrics  # Phase times, I/O counters (metrics.io), output composition
+    bytes_written: int = 0
+    kernel_copies: int = 0
+    budget: Optional[TokenBudget] = None
+    duplicates: Optional[Duplicates] = None
+
+    @property
+    def included(self) -> List[FileRecord]:
+        return [record for record in self.files if record.included]
+
+    @property
+    def references(self) -> List[FileRecord]:
+        """Included files written as "(identical to X)" references."""
+        return [record for record in self.files if record.included and record.duplicate_of is not None]
+
+    @property
+    def bytes_saved(self) -> int:
+        """Output bytes the references saved over merging the files again."""
+        sections = {record.path: record.output_bytes for record in self.files}
+        return sum(sections[record.duplicate_of] - record.output_bytes for record in self.references)
+
+    @property
+    def excluded(self) -> List[FileRecord]:
+        return [record for record in self.files if not record.included]
+
+    @property
+    def files_scanned(self) -> int:
+        return len(self.files) + self.scan_stats.total_skipped
+
+    @property
+    def files_excluded(self) -> int:
+        return len(self.files) - len(self.included) + self.scan_stats.total_skipped
+
+    def exclusion_reasons(self) -> Counter:
+        reasons = Counter(record.reason for record in self.excluded)
+        reasons.update(self.scan_stats.skipped)
+        return reasons
+
+def select_files(
+    paths: Iterable[str],
+    options: MergeOptions,
+    events: FileEvents = FILE_EVENTS,
+) -> tuple[List[Path], ScanStats]:
+    """Unsupported and oversized files are pruned during the walk and only counted."""
+    scan_stats = ScanStats()
+    selected_files = expand_input_paths(
+        paths,
+        options.max_size_bytes,
+        scan_stats,
+        options.walk_workers or options.workers,
+        include=options.include,
+        exclude=options.exclude,
+        read_ignore_files=options.read_ignore_files,
+        events=events,
+    )
+    return selected_files, scan_stats
+
+def selection_base_directory(scan_stats: ScanStats) -> Path:
+    """
+    Directory the section names are relative to: the common path of every
+    scanned file, pruned ones included.
+    """
+    return Path(os.path.commonpath(scan_stats.directories))
+
+def open_merge_resources(
+    options: MergeOptions,
+    resources: ExitStack,
+    warm: Optional["WarmState"] = None,
+) -> tuple[PdfExtractor, Optional[ExtractionCache]]:
+    """
+    PDF extractor and extraction cache for one merge, closed by resources.
+    A resident server lends its warm pool and cache, when the settings match.
+    """
+    if warm is not None and (warm.pdf_extractor.workers, warm.pdf_extractor.time_cap) == (options.pdf_workers, options.pdf_time_cap):
+        pdf_extractor = warm.pdf_extractor
+    else:
+        pdf_extractor = resources.enter_context(
+            closing(PdfExtractor(options.pdf_workers, time_cap=options.pdf_time_cap))
+        )
+    cache = None
+    if options.cache_size_mb > 0:
+        if warm is not None and warm.cache is not None:
+            cache = warm.cache
+            resources.callback(cache.flush)
+        else:
+            cache = resources.enter_context(
+                closing(ExtractionCache(default_cache_path(), options.cache_size_mb * 1024 * 1024))
+            )
+    return pdf_extractor, cache
+
+def _merge_files(
+    writer: OutputWriter,
+    selected_files: List[Path],
+    base_directory: Path,
+    options: MergeOptions,
+    pdf_extractor: PdfExtractor,
+    cache: Optional[ExtractionCache],
+    metrics: RunMetrics,
+    incremental: Optional["IncrementalExport"] = None,
+    budget: Optional[TokenBudget] = None,
+    duplicates: Optional[Duplicates] = None,
+) -> Iterator[FileRecord]:
+    """Write one section per included file; yield each file's record once it is written."""
+    worker = partial(
+        process_file,
+        base_directory=base_directory,
+        max_size_bytes=options.max_size_bytes,
+        max_size_mb=options.max_size_mb,
+        pdf_extractor=pdf_extractor,
+        cache=cache,
+        counters=metrics.io,
+        mmap_threshold=options.mmap_threshold,
+        events=metrics.events,
+    )
+    writer.mmap_threshold = options.mmap_threshold
+    if incremental is not None:
+        worker = partial(incremental.process, worker=worker)
+    # Records of the files duplicates refer to; they always come first
+    originals: dict[Path, Optional[FileRecord]] = {}
+    if duplicates is not None and duplicates.originals:
+        originals = dict.fromkeys(duplicates.originals.values())
+        worker = partial(_reference_duplicate, worker=worker, base_directory=base_directory, duplicates=duplicates)
+
+    # Detection/decoding may run on a thread pool, but results arrive in
+    # input order and only this loop writes: output matches a serial run.
+    results = iter_file_results(selected_files, worker, options.workers)
+    try:
+        for index, result in enumerate(results):
+            original = None
+            if result.duplicate_of is not None:
+                original = originals[duplicates.originals[result.path]]
+                if not original.included:
+                    # Same bytes, same verdict
+                    result.reason = original.reason
+                    if budget is not None and original.reason == REASON_TOKEN_BUDGET:
+                        budget.drop(original.tokens)
+                else:
+                    result.encoding = original.encoding
+
+            if not result.included:
+                metrics.add_file(result, 0.0)
+                record = FileRecord(result.path, result.relative_name, reason=result.reason)
+                if original is not None:
+                    record.tokens = original.tokens
+                if result.path in originals:
+                    originals[result.path] = record
+                yield record
+                continue
+
+            tokens = 0
+            if budget is not None:
+                # Reused sections carry the estimate of the run that wrote them
+                tokens = prepare_section_size(result)[1]
+                if not budget.admit(tokens):
+                    if result.source is not None:
+                        result.source.close()
+                    metrics.add_file(result, 0.0)
+                    record = FileRecord(result.path, result.relative_name, reason=REASON_TOKEN_BUDGET, tokens=tokens)
+                    if result.path in originals:
+                        originals[result.path] = record
+                    yield record
+                    if budget.exhausted:
+                        results.close()
+                        yield from _dropped_unread(selected_files[index + 1:], base_directory, budget)
+                        return
+                    continue
+
+            write_started = time.perf_counter()
+            section_length = 0
+            try:
+                # A sharded writer may start a new part here: take the start after it
+                writer.begin_section(result)
+                section_start = writer.tell()
+                if result.previous_section is not None:
+                    incremental.copy_previous_section(writer, result)
+                    encoding = result.encoding
+                else:
+                    encoding = writer.write_section(result)
+                section_length = writer.tell() - section_start
+                record = FileRecord(
+                    result.path,
+                    result.relative_name,
+                    encoding=encoding,
+                    output_offset=section_start,
+                    output_bytes=section_length,
+                    tokens=tokens,
+                    duplicate_of=original.path if original is not None else None,
+                )
+                # A reference stops being valid when its original changes: never reused
+                if incremental is not None and original is None:
+                    incremental.record(result, encoding, section_start, section_length, tokens)
+
+                if DEV_MODE:
+                    logging.debug("Merged file: %s", result.relative_name)
+
+            except Exception as exception:
+                record = FileRecord(result.path, result.relative_name, reason=f"Error: {exception}")
+                metrics.events.record(
+                    f"error writing ({type(exception).__name__})",
+                    logging.ERROR,
+                    "Error processing file %s: %s",
+                    result.path,
+                    exception,
+                    exc_info=True,
+                )
+            metrics.add_file(result, time.perf_counter() - write_started, section_length)
+            if result.path in originals:
+                originals[result.path] = record
+            yield record
+    finally:
+        if incremental is not None:
+            incremental.close()
+
+def _reference_duplicate(
+    file_path: Path,
+    worker: Callable[[Path], FileResult],
+    base_directory: Path,
+    duplicates: Duplicates,
+) -> FileResult:
+    """Duplicates become references without being read; other files go to worker."""
+    original = duplicates.originals.get(file_path)
+    if original is None:
+        return worker(file_path)
+    return FileResult(
+        file_path,
+        section_name(file_path, base_directory),
+        duplicate_of=section_name(original, base_directory),
+    )
+
+def _dropped_unread(files: List[Path], base_directory: Path, budget: TokenBudget) -> Iterator[FileRecord]:
+    """Records of the files after a "stop" budget ran out: never read, tokens estimated from their size."""
+    for file_path in files:
+        try:
+            tokens = estimate_tokens(file_path.stat().st_size, file_path.suffix)
+        except OSError:
+            tokens = 0
+        budget.drop(tokens)
+        yield FileRecord(file_path, section_name(file_path, base_directory), reason=REASON_TOKEN_BUDGET, tokens=tokens)
+
+def write_summary(writer: OutputWriter, result: MergeResult, output_name: str, workers: int) -> None:
+    """The EXTRACTION SUMMARY block at the end of the output."""
+    writer.write_text("\n\n")
+    writer.write_text("="*80 + "\n")
+    writer.write_text("EXTRACTION SUMMARY\n")
+    writer.write_text("="*80 + "\n\n")
+
+    # Application info
+    writer.write_text(f"Generated by: {APP_NAME} v{VERSION}\n")
+    writer.write_text(f"{COPYRIGHT}\n")
+    writer.write_text(f"Extraction date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    writer.write_text(f"Base directory: {result.base_directory}\n")
+    writer.write_text(f"Output file: {output_name}\n")
+    writer.write_text("\n")
+
+    # Statistics
+    included_files = result.included
+    excluded_files = result.excluded
+    scan_stats = result.scan_stats
+    total_skipped = scan_stats.total_skipped
+    total_files = result.files_scanned
+    total_included = len(included_files)
+    total_excluded = result.files_excluded
+
+    writer.write_text(f"Files scanned: {total_files}\n")
+    writer.write_text(f"Files included: {total_included}\n")
+    writer.write_text(f"Files excluded: {total_excluded}\n")
+    writer.write_text(f"Verification: {total_included} + {total_excluded} = {total_included + total_excluded} ")
+
+    if total_included + total_excluded == total_files:
+        writer.write_text("✓ OK\n")
+    else:
+        writer.write_text(f"✗ MISMATCH (expected {total_files})\n")
+
+    if included_files:
+        encoding_counts = Counter(record.encoding for record in included_files)
+        writer.write_text("Encodings: " + ", ".join(
+            f"{encoding} {count}" for encoding, count in encoding_counts.most_common()
+        ) + "\n")
+    if result.budget is not None:
+        budget = result.budget
+        writer.write_text(
+            f"Token budget ({budget.policy}): about {budget.used:,} of {budget.limit:,} tokens used, "
+            f"{budget.dropped} files dropped (about {budget.dropped_tokens:,} tokens)\n"
+        )
+    references = result.references
+    if references:
+        writer.write_text(
+            f"Duplicates: {len(references)} files identical to an earlier one written as references, "
+            f"{_format_bytes(result.bytes_saved)} saved ({result.duplicates.same_inode} hard links/symlinks)\n"
+        )
+    write_cost_summary(writer, result.metrics, total_files, workers)
+
+    writer.write_text("\n")
+
+    # Included files with absolute paths
+    if included_files:
+        writer.write_text(f"\n--- INCLUDED FILES ({total_included}) ---\n\n")
+        for idx, record in enumerate(included_files, 1):
+            if record.duplicate_of is not None:
+                writer.write_text(f"{idx:4}. {record.path} [identical to {record.duplicate_of}]\n")
+            else:
+                writer.write_text(f"{idx:4}. {record.path} [{record.encoding}]\n")
+
+    # Excluded files with reasons
+    if excluded_files:
+        writer.write_text(f"\n--- EXCLUDED FILES ({len(excluded_files)}) ---\n\n")
+        for idx, record in enumerate(excluded_files, 1):
+            writer.write_text(f"{idx:4}. {record.path}\n")
+            if record.reason == REASON_TOKEN_BUDGET:
+                writer.write_text(f"      Reason: {record.reason} (about {record.tokens:,} tokens)\n")
+            else:
+                writer.write_text(f"      Reason: {record.reason}\n")
+
+    # Files pruned during the directory walk: counts only
+    if total_skipped:
+        writer.write_text(f"\n--- SKIPPED DURING SCAN ({total_skipped}) ---\n\n")
+        for reason, count in scan_stats.skipped.most_common():
+            writer.write_text(f"{count:6}  {reason}\n")
+    if scan_stats.pruned_directories:
+        writer.write_text(f"\nIgnored folders not scanned: {scan_stats.pruned_directories}\n")
+
+    writer.write_text("\n")
+    writer.write_text("="*80 + "\n")
+    writer.write_text("END OF EXTRACTION SUMMARY\n")
+    writer.write_text("="*80 + "\n")
+
+def merge_selection(
+    writer: OutputWriter,
+    selection: tuple[List[Path], ScanStats],
+    options: MergeOptions,
+    pdf_extractor: PdfExtractor,
+    cache: Optional[ExtractionCache],
+    metrics: RunMetrics,
+    incremental: Optional["IncrementalExport"] = None,
+    output_name: str = "",
+) -> MergeResult:
+    """Merge already selected files (and the summary) into writer: the core of merge() and run_export()."""
+    selected_files, scan_stats = selection
+    start = writer.written()
+    kernel_copies = writer.kernel_copies
+    result = MergeResult([], scan_stats, selection_base_directory(scan_stats), metrics)
+    if options.token_budget is not None:
+        result.budget = TokenBudget(options.token_budget, options.budget_policy)
+    if options.dedupe:
+        with metrics.phase("dedupe"):
+            result.duplicates = find_duplicates(selected_files, options.workers, metrics.io)
+    try:
+        result.files.extend(_merge_files(
+            writer,
+            selected_files,
+            result.base_directory,
+            options,
+            pdf_extractor,
+            cache,
+            metrics,
+            incremental,
+            result.budget,
+            result.duplicates,
+        ))
+    finally:
+        if cache is not None:
+            logging.info("Extraction cache: %d hits, %d misses", cache.hits, cache.misses)
+
+    writer.end_of_sections()
+    if options.summary:
+        write_summary(writer, result, output_name, options.workers)
+    result.bytes_written = writer.written() - start
+    result.kernel_copies = writer.kernel_copies - kernel_copies
+    return result
+
+def merge(
+    paths: Iterable[Union[str, os.PathLike]],
+    *,
+    sink: BinaryIO,
+    options: Optional[MergeOptions] = None,
+) -> MergeResult:
+    """
+    Merge the files selected by paths (files and folders, walked like on
+    the command line) into sink, any writable binary file-like object, and
+    return one record per file. Nothing is printed or shown and sys.exit
+    is never called: a selection without mergeable files raises ValueError.
+
+    Each call has its own PDF pool, cache connection and I/O counters, so
+    concurrent calls from several threads of one process are safe.
+    """
+    options = options if options is not None else MergeOptions()
+    paths = [os.fspath(path) for path in paths]
+    metrics = RunMetrics()
+    with metrics.phase("walk"):
+        selection = select_files(paths, options, metrics.events)
+    if not selection[0]:
+        raise ValueError(f"No valid text files found in: {', '.join(paths)}")
+
+    output_name = options.output_name or str(getattr(sink, "name", "<stream>"))
+    with ExitStack() as resources:
+        pdf_extractor, cache = open_merge_resources(options, resources)
+        return merge_selection(
+            OutputWriter(sink, metrics.io),
+            selection,
+            options,
+            pdf_extractor,
+            cache,
+            metrics,
+            output_name=output_name,
+        )
+
+def iter_sections(
+    paths: Iterable[Union[str, os.PathLike]],
+    *,
+    options: Optional[MergeOptions] = None,
+) -> Iterator[Section]:
+    """
+    Lazy merge(): yield one Section per selected file, in output order,
+    holding the exact bytes merge() would write for it (excluded files
+    come with empty data and their reason). The summary is not produced.
+    Only one section is held in memory at a time.
+    """
+    options = options if options is not None else MergeOptions()
+    paths = [os.fspath(path) for path in paths]
+    metrics = RunMetrics()
+    selection = select_files(paths, options, metrics.events)
+    duplicates = find_duplicates(selection[0], options.workers, metrics.io) if options.dedupe else None
+    budget = TokenBudget(options.token_budget, options.budget_policy) if options.token_budget is not None else None
+    buffer = io.BytesIO()
+    writer = OutputWriter(buffer, metrics.io)
+    offset = 0
+    with ExitStack() as resources:
+        pdf_extractor, cache = open_merge_resources(options, resources)
+        for record in _merge_files(
+            writer,
+            selection[0],
+            selection_base_directory(selection[1]) if selection[0] else Path(),
+            options,
+            pdf_extractor,
+            cache,
+            metrics,
+            budget=budget,
+            duplicates=duplicates,
+        ):
+            data = buffer.getvalue()
+            writer.rewind(0)
+            if record.included:
+                record.output_offset = offset
+                offset += len(data)
+            yield Section(record, data)
+
+# =========================
+# Main logic
+# =========================
+
+def show_notification(message: str) -> None:
+    """
+    Show Windows notification (with full error logging).
+    Note: win10toast is optional and may have internal issues on some systems.
+    """
+    try:
+        import warnings
+        with warnings.catch_warnings(record=True) as warning_list:
+            warnings.simplefilter("always")
+            from win10toast import ToastNotifier
+            toaster = ToastNotifier()
+            toaster.show_toast(
+                "Folder2Text",
+                message,
+                duration=5,
+                threaded=False, # Non-threaded to capture all exceptions
+                icon_path=None  # Explicitly disable icon lookup to prevent PyInstaller crash
+            )
+
+            # Log any warnings from win10toast
+            if warning_list:
+                for warning_item in warning_list:
+                    logging.debug("win10toast warning: %s - %s",
+                                 warning_item.category.__name__,
+                                 warning_item.message)
+
+        logging.debug("Windows notification completed (may have shown)")
+    except ImportError as import_err:
+        logging.warning("win10toast library not available: %s", import_err)
+        logging.debug("Notification skipped - library missing (non-critical)")
+    except Exception as notify_err:
+        import traceback
+        logging.warning("Windows notification failed (non-critical): %s", notify_err)
+        logging.debug("Notification exception type: %s", type(notify_err).__name__)
+        logging.debug("Notification exception traceback:\n%s", traceback.format_exc())
+
+def default_output_location(paths: List[str]) -> tuple[Path, str]:
+    """
+    (output directory, folder name) for output-<folder>-<timestamp>.txt:
+    the output is created one level up from where the user clicked.
+    """
+    # Get the first argument path (what user clicked on)
+    first_arg_path = Path(paths[0]).resolve()
+
+    # If user clicked on a directory, use its parent for output
+    # If user clicked on a file, use its parent's parent for output
+    if first_arg_path.is_dir():
+        return first_arg_path.parent, first_arg_path.name
+    return first_arg_path.parent.parent, first_arg_path.parent.name
+
+def run_export(
+    args: argparse.Namespace,
+    selection: Optional[tuple[List[Path], ScanStats]] = None,
+    notify: bool = True,
+    warm: Optional["WarmState"] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> int:
+    """
+    One command-line export: merge() into a temporary file, moved to the
+    output path when complete, plus logging, --stats-json and the
+    notification. selection is the result of select_files(), when already
+    known; warm holds the PDF pool and cache of a resident server
+    (--serve); metrics may already hold the validation time (main()).
+    Returns the exit code.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    options = MergeOptions.from_arguments(args)
+    if selection is None:
+        with metrics.phase("walk"):
+            selection = select_files(args.paths, options, metrics.events)
+    selected_files, scan_stats = selection
+
+    if not selected_files:
+        logging.error("No valid text files found in provided paths")
+        logging.debug("Searched paths: %s", args.paths)
+        logging.debug("Total paths provided: %d", len(args.paths))
+        print(f"\nERROR: No valid text files found in the specified location(s).")
+        print(f"Searched: {', '.join(str(p) for p in args.paths)}")
+        return EXIT_NO_FILES
+
+    base_directory = selection_base_directory(scan_stats)
+
+    # Determine output directory: always use parent of base_directory
+    # This ensures output is created one level up from where user clicked
+    if args.output:
+        output_file = args.output.resolve()
+        output_directory = output_file.parent
+    else:
+        output_directory, folder_name = default_output_location(args.paths)
+        output_file = output_directory / f"output-{folder_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+    if args.compress is not None and not output_file.name.lower().endswith(COMPRESSION_SUFFIXES[args.compress]):
+        output_file = output_file.with_name(output_file.name + COMPRESSION_SUFFIXES[args.compress])
+
+    logging.debug("Output will be created in: %s", output_directory)
+    logging.debug("Output file: %s", output_file)
+
+    incremental: Optional[IncrementalExport] = None
+    if args.incremental:
+        if args.output:
+            previous_manifest = manifest_path(output_file)
+            if not previous_manifest.exists():
+                previous_manifest = None
+        else:
+            previous_manifest = find_previous_manifest(output_directory, folder_name)
+        # Everything that changes the output besides the files themselves
+        settings = {
+            "app_version": VERSION,
+            "paths": sorted(
+                str(Path(sanitize_argument(path)).expanduser().resolve())
+                for path in args.paths
+                if sanitize_argument(path)
+            ),
+            "base_directory": str(base_directory),
+            "max_size_mb": args.max_size_mb,
+            "include": args.include,
+            "exclude": args.exclude,
+            "ignore_files": not args.no_ignore,
+            "token_budget": args.token_budget,
+            "budget_policy": args.budget_policy,
+            "dedupe": args.dedupe,
+        }
+        incremental = IncrementalExport(previous_manifest, settings, selected_files, scan_stats)
+        if incremental.unchanged:
+            logging.info("Incremental: nothing changed since %s", incremental.previous_output)
+            if notify:
+                show_notification(f"No changes since the last export\n{incremental.previous_output.name}")
+            return EXIT_OK
+
+    import shutil
+    import tempfile
+
+    with ExitStack() as run_resources:
+        pdf_extractor, cache = open_merge_resources(options, run_resources, warm)
+        if args.shard_size is not None:
+            # Parts are moved into place while the merge goes on
+            writer = ShardedOutputWriter(output_file, *args.shard_size, args.compress, metrics.io, metrics)
+            run_resources.callback(writer.discard)
+        else:
+            temporary_file = run_resources.enter_context(
+                tempfile.NamedTemporaryFile(mode="w+b", delete=False, suffix=".tmp")
+            )
+            temporary_path = Path(temporary_file.name)
+            sink = temporary_file
+            if args.compress is not None:
+                # Sections are compressed as they are written; closed (flushed) before the move
+                sink = run_resources.enter_context(closing(open_compressed_sink(temporary_file, args.compress)))
+            writer = OutputWriter(sink, metrics.io)
+        result = merge_selection(
+            writer,
+            selection,
+            options,
+            pdf_extractor,
+            cache,
+            metrics,
+            incremental=incremental,
+            output_name=str(shard_path(output_file, 0)).replace(".part00", ".partNN") if args.shard_size else str(output_file),
+        )
+        if args.shard_size is not None:
+            output_files = writer.finish()
+
+    if args.shard_size is None:
+        # Use shutil.move instead of os.replace to support cross-drive moves
+        with metrics.phase("move"):
+            shutil.move(temporary_path, output_file)
+        output_files = [output_file]
+
+    if incremental is not None:
+        incremental.write_manifest(output_file)
+        if incremental.previous_output is not None:
+            logging.info("Incremental: %d sections reused from %s", incremental.reused, incremental.previous_output)
+
+    # Log completion with summary (no console output in windowed mode)
+    output_size = sum(path.stat().st_size for path in output_files)
+    logging.info("Process completed successfully: %s", output_files[-1])
+    if len(output_files) > 1:
+        logging.info("Output split into %d parts", len(output_files))
+    logging.info("Total files scanned: %d", result.files_scanned)
+    logging.info("Files included: %d", len(result.included))
+    logging.info("Files excluded: %d", result.files_excluded)
+    if result.budget is not None:
+        logging.info(
+            "Token budget: ~%d of %d tokens used, %d files dropped",
+            result.budget.used,
+            result.budget.limit,
+            result.budget.dropped,
+        )
+    if result.references:
+        logging.info("Duplicates: %d files written as references, %d bytes saved", len(result.references), result.bytes_saved)
+    logging.info("Output size: %.2f MB", output_size / (1024*1024))
+    if args.compress is not None:
+        logging.info("Compressed with %s from %.2f MB", args.compress, result.bytes_written / (1024*1024))
+    logging.info("Output location: %s", output_file.parent)
+    metrics.events.log_totals()
+    logging.info(
+        "Input I/O: %d opens, %d read calls, %d memory-mapped, %.2f MB read, %d kernel copies",
+        metrics.io.opens,
+        metrics.io.reads,
+        metrics.io.mapped,
+        metrics.io.bytes_read / (1024*1024),
+        result.kernel_copies,
+    )
+
+    if args.stats_json is not None:
+        metrics.write_json(
+            args.stats_json,
+            output_file=str(output_files[-1]),
+            output_parts=[str(path) for path in output_files] if args.shard_size is not None else None,
+            bytes_written=output_size,
+            bytes_uncompressed=result.bytes_written,
+            files_scanned=result.files_scanned,
+            files_included=len(result.included),
+            files_excluded=result.files_excluded,
+            exclusion_reasons=dict(result.exclusion_reasons().most_common()),
+            workers=args.workers,
+            cache={"hits": cache.hits, "misses": cache.misses} if cache is not None else None,
+            sections_reused=incremental.reused if incremental is not None else 0,
+            token_budget={
+                "limit": result.budget.limit,
+                "policy": result.budget.policy,
+                "used": result.budget.used,
+                "files_dropped": result.budget.dropped,
+                "tokens_dropped": result.budget.dropped_tokens,
+            } if result.budget is not None else None,
+            duplicates={
+                "files": len(result.references),
+                "same_inode": result.duplicates.same_inode,
+                "bytes_hashed": result.duplicates.bytes_hashed,
+                "bytes_saved": result.bytes_saved,
+            } if result.duplicates is not None else None,
+        )
+
+    if notify:
+        if len(output_files) > 1:
+            show_notification(f"Merged {len(result.included)} files into {len(output_files)} parts\n{output_files[0].name}")
+        else:
+            show_notification(f"Merged {len(result.included)} files successfully!\n{output_files[0].name}")
+    return EXIT_OK
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    """Run the command line (parsed from sys.argv unless given); exits with its code."""
+    if args is None:
+        args = parse_arguments()
+
+    configure_logging(args.verbose)
+    logging.debug("Arguments received: %s", args.paths)
+
+    if args.serve:
+        sys.exit(serve(args))
+
+    # Validate selection before processing
+    metrics = RunMetrics()
+    with metrics.phase("validate"):
+        is_valid, error_message = validate_selection(args.paths)
+    if not is_valid:
+        logging.warning("Invalid selection: %s", error_message)
+        # Show user-friendly error dialog (windowed mode)
+        try:
+            import tkinter as tk
+            from tkinter import messagebox
+            root = tk.Tk()
+            root.withdraw()  # Hide main window
+            messagebox.showerror(
+                f"{APP_NAME} - Invalid Selection",
+                error_message
+            )
+            root.destroy()
+        except Exception:
+            # Fallback to console error
+            print(f"\nERROR: {error_message}")
+        sys.exit(EXIT_NO_FILES)
+
+    if args.watch:
+        sys.exit(run_profiled(watch, args) if args.profile else watch(args))
+
+    if args.profile:
+        exit_code = run_profiled(run_export, args, metrics=metrics)
+    else:
+        exit_code = run_export(args, metrics=metrics)
+
+    # Exit silently (no console pause needed in windowed mode)
+    logging.debug("Application completed - exiting silently")
+    sys.exit(exit_code)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Folder2Text - Throughput Benchmark Suite
+========================================
+
+Generates a synthetic tree (tree_generator.py, fixed seed) and measures
+files/sec, MB/s and peak RSS of:
+
+- expand_input_paths   directory walk and pruning
+- is_probably_text_file binary/text detection on every scanned file
+- read_text_safely     read + decode of every text file
+- extract_pdf_text     PDF extraction (skipped if PyPDF2 is missing)
+- main                 a full export (sys.argv + main(), cache disabled)
+
+Each benchmark runs in its own child process, so peak RSS is not inflated
+by the previous ones and imports are cold.
+
+Usage:
+    python tests/benchmark/run_benchmarks.py --output results.json
+    python tests/benchmark/run_benchmarks.py --baseline results.json --max-regression 15
+    python tests/benchmark/run_benchmarks.py --files 20000 --median-kb 8 --only main
+
+With --baseline the run is compared benchmark by benchmark (MB/s); a drop
+larger than --max-regression percent exits with code 1. Baselines are only
+comparable when the tree parameters match (they are stored in the JSON).
+"""
+
+import os
+import sys
+import json
+import argparse
+import importlib.util
+import platform
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tree_generator import TreeSpec, generate_tree
+
+DEFAULT_SCRIPT = Path(__file__).resolve().parents[2] / "src" / "Folder2Text.py"
+MAX_SIZE_BYTES = 10 * 1024 * 1024  # Same as the --max-size-mb default
+BENCHMARKS = ["expand_input_paths", "is_probably_text_file", "read_text_safely", "extract_pdf_text", "main"]
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of the current process, None if unavailable."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KB
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset  # Windows
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_child(name: str, script: Path, tree: Path, workdir: Path) -> Dict[str, object]:
+    """Body of one benchmark, executed inside the child process."""
+    sys.path.insert(0, str(script.parent))
+    app = __import__(script.stem)
+
+    if name == "extract_pdf_text" and importlib.util.find_spec("PyPDF2") is None:
+        return {"skipped": "PyPDF2 not installed"}
+
+    # Inputs are collected outside the timed region (except for the walk itself)
+    if name in ("expand_input_paths", "main"):
+        inputs = []
+    else:
+        files = app.expand_input_paths([str(tree)], MAX_SIZE_BYTES)
+        if name == "extract_pdf_text":
+            inputs = [path for path in files if path.suffix.lower() == ".pdf"]
+        else:
+            inputs = [path for path in files if path.suffix.lower() != ".pdf"]
+            if name == "read_text_safely":
+                inputs = [path for path in inputs if app.is_probably_text_file(path)]
+
+    started = time.perf_counter()
+    if name == "expand_input_paths":
+        inputs = app.expand_input_paths([str(tree)], MAX_SIZE_BYTES)
+    elif name == "main":
+        sys.argv = [str(script), str(tree), "-o", str(workdir / "output.txt"), "--no-cache"]
+        try:
+            app.main()
+        except SystemExit:
+            pass
+    else:
+        function = getattr(app, name)
+        for path in inputs:
+            function(path)
+    seconds = time.perf_counter() - started
+
+    if name == "main":
+        # Throughput of a full export is measured on everything it scanned
+        inputs = [path for path in tree.rglob("*") if path.is_file()]
+    size = sum(path.stat().st_size for path in inputs)
+    peak = peak_rss_bytes()
+    return {
+        "files": len(inputs),
+        "bytes": size,
+        "seconds": round(seconds, 4),
+        "files_per_sec": round(len(inputs) / seconds, 1),
+        "mb_per_sec": round(size / (1024 * 1024) / seconds, 2),
+        "peak_rss_mb": None if peak is None else round(peak / (1024 * 1024), 1),
+    }
+
+
+def run_benchmark(name: str, script: Path, tree: Path, workdir: Path) -> Dict[str, object]:
+    env = dict(os.environ, LOCALAPPDATA=str(workdir / "appdata"))
+    completed = subprocess.run(
+        [sys.executable, __file__, "--child", name, "--script", str(script), "--tree", str(tree), "--workdir", str(workdir)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_regression: Optional[float]) -> List[str]:
+    """Print MB/s deltas against the baseline; return the regressed benchmarks."""
+    regressions = []
+    print("\nAgainst baseline")
+    for name, result in results.items():
+        before = baseline.get(name, {}).get("mb_per_sec")
+        after = result.get("mb_per_sec")
+        if not before or after is None:
+            continue
+        delta = (after - before) / before * 100
+        marker = ""
+        if max_regression is not None and delta < -max_regression:
+            regressions.append(name)
+            marker = "  [REGRESSION]"
+        print(f"  {name:<22} {before:9.2f} -> {after:9.2f} MB/s  {delta:+6.1f}%{marker}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Folder2Text throughput benchmarks on a synthetic tree")
+    parser.add_argument("--script", type=Path, default=DEFAULT_SCRIPT, help="Folder2Text.py to measure")
+    parser.add_argument("--files", type=int, default=TreeSpec.files)
+    parser.add_argument("--depth", type=int, default=TreeSpec.depth)
+    parser.add_argument("--median-kb", type=float, default=TreeSpec.median_kb)
+    parser.add_argument("--binary-ratio", type=float, default=TreeSpec.binary_ratio)
+    parser.add_argument("--disguised-ratio", type=float, default=TreeSpec.disguised_ratio)
+    parser.add_argument("--pdfs", type=int, default=TreeSpec.pdfs)
+    parser.add_argument("--seed", type=int, default=TreeSpec.seed)
+    parser.add_argument("--only", choices=BENCHMARKS, action="append", help="Run only these benchmarks (repeatable)")
+    parser.add_argument("--output", type=Path, help="Write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare against a previous results JSON")
+    parser.add_argument("--max-regression", type=float, help="Fail if MB/s drops more than this percent vs the baseline")
+    # Internal: run one benchmark and print its JSON result
+    parser.add_argument("--child", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument("--tree", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    script = args.script.resolve()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, script, args.tree, args.workdir)))
+        return 0
+
+    spec = TreeSpec(
+        files=args.files,
+        depth=args.depth,
+        median_kb=args.median_kb,
+        binary_ratio=args.binary_ratio,
+        disguised_ratio=args.disguised_ratio,
+        pdfs=args.pdfs,
+        seed=args.seed,
+    )
+    results = {}
+    with tempfile.TemporaryDirectory() as temporary:
+        workdir = Path(temporary)
+        tree = workdir / "tree"
+        tree.mkdir()
+        counts = generate_tree(tree, spec)
+        print(f"Synthetic tree: {counts['files']} files ({counts['text']} text, {counts['binary']} binary "
+              f"({counts['disguised']} with a text extension), "
+              f"{counts['pdf']} PDF), {counts['bytes'] / (1024 * 1024):.1f} MB")
+        print(f"  {'benchmark':<22} {'files/s':>10} {'MB/s':>9} {'peak RSS':>9}")
+
+        for name in args.only or BENCHMARKS:
+            result = run_benchmark(name, script, tree, workdir)
+            results[name] = result
+            if "files_per_sec" in result:
+                rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.1f} MB"
+                print(f"  {name:<22} {result['files_per_sec']:>10} {result['mb_per_sec']:>9} {rss:>9}")
+            else:
+                print(f"  {name:<22} {result.get('skipped') or 'ERROR: ' + result['error']}")
+
+    report = {
+        "script": str(script),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tree": asdict(spec),
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("tree") != report["tree"]:
+            print("\nWARNING: baseline was measured on a different tree; deltas are not comparable")
+        if compare(results, baseline.get("results", {}), args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Folder2Text - Startup Benchmark
+===============================
+
+Measures the cold-start cost paid by every context-menu click:
+
+- Import report: `python -X importtime` of Folder2Text.py, heaviest modules first
+- Wall clock: median of N runs of `--help` and of a tiny export (one file)
+- With --serve, also a tiny export forwarded to a resident `--serve` process
+- Compile: median time to compile the script to bytecode. `python Folder2Text.py`
+  pays it on every run (the main script is never cached in __pycache__);
+  frozen builds ship bytecode and do not
+
+Usage:
+    python tests/benchmark/startup_benchmark.py
+    python tests/benchmark/startup_benchmark.py --script old/Folder2Text.py   # compare a checkout
+    python tests/benchmark/startup_benchmark.py --budget-ms 150              # fail above budget
+    python tests/benchmark/startup_benchmark.py --serve                      # forwarded export too
+
+The tiny export runs with LOCALAPPDATA pointed at a temporary directory,
+so logs and cache of the real installation are not touched.
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+DEFAULT_SCRIPT = Path(__file__).resolve().parents[2] / "src" / "Folder2Text.py"
+
+
+def import_report(script: Path, top: int) -> Tuple[int, List[Tuple[int, int, str]]]:
+    """(total microseconds, [(self_us, cumulative_us, module)]) from -X importtime."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {script.stem}"],
+        cwd=script.parent,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), module[1:].rstrip()))
+    total = next((cumulative for _, cumulative, module in rows if module.strip() == script.stem), 0)
+    # Top-level imports of the script (one level of indentation below it)
+    direct = [row for row in rows if row[2].startswith("  ") and not row[2].startswith("   ")]
+    return total, sorted(direct, key=lambda row: row[1], reverse=True)[:top]
+
+
+def wall_clock_ms(command: List[str], runs: int, env: dict) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, capture_output=True, env=env)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def compile_ms(script: Path, runs: int) -> float:
+    source = script.read_bytes()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        compile(source, str(script), "exec")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def forwarded_export_ms(script: Path, command: List[str], runs: int, env: dict, appdata: Path) -> Optional[float]:
+    """Median of the tiny export with a --serve process running, None if it does not start."""
+    server = subprocess.Popen([sys.executable, str(script), "--serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    try:
+        info = appdata / "Folder2Text" / "server.json"
+        deadline = time.monotonic() + 10
+        while not info.exists():
+            if server.poll() is not None or time.monotonic() > deadline:
+                return None
+            time.sleep(0.05)
+        return wall_clock_ms(command, runs, env)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Folder2Text cold-start benchmark")
+    parser.add_argument("--script", type=Path, default=DEFAULT_SCRIPT, help="Folder2Text.py to measure")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per wall-clock measurement")
+    parser.add_argument("--top", type=int, default=12, help="Modules listed in the import report")
+    parser.add_argument("--budget-ms", type=float, help="Fail if the tiny export takes longer (median)")
+    parser.add_argument("--serve", action="store_true", help="Also time the tiny export forwarded to a --serve process")
+    args = parser.parse_args()
+    script = args.script.resolve()
+
+    total_us, modules = import_report(script, args.top)
+    print(f"Import report for {script}")
+    print(f"  {'cumulative ms':>13}  {'self ms':>8}  module")
+    for self_us, cumulative_us, module in modules:
+        print(f"  {cumulative_us / 1000:13.1f}  {self_us / 1000:8.1f}  {module.strip()}")
+    print(f"  {total_us / 1000:13.1f}  {'':8}  TOTAL (import {script.stem})")
+    print()
+
+    with tempfile.TemporaryDirectory() as temporary:
+        temporary_path = Path(temporary)
+        source = temporary_path / "project"
+        source.mkdir()
+        (source / "readme.txt").write_text("hello\n", encoding="utf-8")
+        appdata = temporary_path / "appdata"
+        env = dict(os.environ, LOCALAPPDATA=str(appdata))
+        export_command = [sys.executable, str(script), str(source), "-o", str(temporary_path / "output.txt")]
+
+        help_ms = wall_clock_ms([sys.executable, str(script), "--help"], args.runs, env)
+        export_ms = wall_clock_ms(export_command, args.runs, env)
+        forwarded_ms = forwarded_export_ms(script, export_command, args.runs, env, appdata) if args.serve else None
+
+    print(f"Wall clock (median of {args.runs})")
+    print(f"  --help       {help_ms:8.1f} ms")
+    print(f"  tiny export  {export_ms:8.1f} ms")
+    print(f"  of which compiling the script {compile_ms(script, args.runs):.1f} ms (not paid by frozen builds)")
+    if args.serve:
+        print(f"  forwarded    {forwarded_ms:8.1f} ms" if forwarded_ms is not None else "  forwarded         n/a (--serve did not start)")
+
+    if args.budget_ms is not None and export_ms > args.budget_ms:
+        print(f"\n[FAIL] tiny export {export_ms:.1f} ms > budget {args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
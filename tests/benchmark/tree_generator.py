@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Folder2Text - Synthetic Source Tree Generator
+=============================================
+
+Builds reproducible source trees for the benchmarks: the same TreeSpec
+(seed included) always produces the same files, byte for byte.
+
+Knobs: file count, directory depth and fan-out, size distribution
+(log-normal around a median, capped), share of binary files and how many
+of them carry a text extension, mix of text encodings (including CRLF line
+endings) and number of PDFs.
+
+Usage:
+    python tests/benchmark/tree_generator.py OUTPUT_DIR --files 5000 --depth 4
+"""
+
+import sys
+import json
+import math
+import random
+import argparse
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+TEXT_EXTENSIONS = [".py", ".js", ".ts", ".java", ".md", ".txt", ".json", ".xml", ".sql", ".yaml", ".cpp", ".cs"]
+BINARY_EXTENSIONS = [".png", ".jpg", ".zip", ".exe", ".dll", ".bin"]
+# Extensions Folder2Text accepts: binary files named like this reach content detection
+DISGUISED_BINARY_EXTENSIONS = [".txt", ".json", ".log"]
+WORDS = (
+    "def class return import value index result buffer stream folder merge output "
+    "config parser token chunk offset length encode decode render request handler"
+).split()
+
+# Encoding name -> relative weight in the default mix
+DEFAULT_ENCODINGS = {
+    "ascii": 50,
+    "utf-8": 30,
+    "utf-8-crlf": 8,
+    "utf-8-sig": 4,
+    "cp1252": 5,
+    "utf-16": 3,
+}
+
+
+@dataclass
+class TreeSpec:
+    """Everything that determines the generated tree."""
+    files: int = 2000
+    depth: int = 3
+    fanout: int = 6
+    median_kb: float = 4.0
+    max_kb: float = 512.0
+    size_sigma: float = 1.2  # Log-normal spread around median_kb
+    binary_ratio: float = 0.15
+    disguised_ratio: float = 0.5  # Share of binary files given a text extension (not pruned by name)
+    encodings: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_ENCODINGS))
+    pdfs: int = 5
+    pdf_pages: int = 20
+    seed: int = 1234
+
+
+def _directories(spec: TreeSpec, rng: random.Random) -> List[Path]:
+    directories = [Path(".")]
+    frontier = [Path(".")]
+    for level in range(spec.depth):
+        next_frontier = []
+        for parent in frontier:
+            for index in range(rng.randint(1, spec.fanout)):
+                child = parent / f"dir{level}_{index}"
+                directories.append(child)
+                next_frontier.append(child)
+        frontier = next_frontier
+    return directories
+
+
+def _text_content(size: int, rng: random.Random, non_ascii: bool) -> str:
+    lines = []
+    length = 0
+    while length < size:
+        words = rng.choices(WORDS, k=rng.randint(3, 12))
+        if non_ascii and rng.random() < 0.2:
+            words.append(rng.choice(["caffè", "naïve", "façade", "über", "€uro", "señal"]))
+        line = " " * (4 * rng.randint(0, 3)) + " ".join(words)
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def _encode(text: str, encoding: str) -> bytes:
+    if encoding == "utf-8-crlf":
+        return text.replace("\n", "\r\n").encode("utf-8")
+    if encoding == "ascii":
+        return text.encode("ascii", errors="ignore")
+    return text.encode(encoding, errors="replace")
+
+
+def make_pdf(pages: int, rng: random.Random) -> bytes:
+    """Minimal valid PDF with one line of Helvetica text per page (no dependencies)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * index} 0 R" for index in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("ascii"))
+    font_id = 3 + 2 * pages
+    for index in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * index} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode("ascii")
+        )
+        text = " ".join(rng.choices(WORDS, k=8))
+        stream = f"BT /F1 12 Tf 72 700 Td (Page {index + 1} {text}) Tj ET".encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return output
+
+
+def generate_tree(root: Path, spec: TreeSpec) -> Dict[str, int]:
+    """
+    Write the tree described by spec under root (which should be empty).
+    Returns counts: files, text, binary (of which disguised: with a text
+    extension), pdf, bytes.
+    """
+    rng = random.Random(spec.seed)
+    directories = _directories(spec, rng)
+    for directory in directories:
+        (root / directory).mkdir(parents=True, exist_ok=True)
+
+    encodings = list(spec.encodings)
+    weights = [spec.encodings[name] for name in encodings]
+    mu = math.log(spec.median_kb * 1024)
+    counts = {"files": 0, "text": 0, "binary": 0, "disguised": 0, "pdf": 0, "bytes": 0}
+
+    for index in range(spec.files):
+        directory = root / rng.choice(directories)
+        size = int(min(rng.lognormvariate(mu, spec.size_sigma), spec.max_kb * 1024)) + 1
+
+        if index < spec.pdfs:
+            data = make_pdf(spec.pdf_pages, rng)
+            path = directory / f"document_{index}.pdf"
+            counts["pdf"] += 1
+        elif rng.random() < spec.binary_ratio:
+            data = bytes(rng.getrandbits(8) for _ in range(min(size, 65536)))
+            data = data * (size // len(data)) + data[:size % len(data)]
+            if rng.random() < spec.disguised_ratio:
+                path = directory / f"blob_{index}{rng.choice(DISGUISED_BINARY_EXTENSIONS)}"
+                counts["disguised"] += 1
+            else:
+                path = directory / f"blob_{index}{rng.choice(BINARY_EXTENSIONS)}"
+            counts["binary"] += 1
+        else:
+            encoding = rng.choices(encodings, weights)[0]
+            text = _text_content(size, rng, non_ascii=encoding != "ascii")
+            data = _encode(text, encoding)
+            path = directory / f"file_{index}{rng.choice(TEXT_EXTENSIONS)}"
+            counts["text"] += 1
+
+        path.write_bytes(data)
+        counts["files"] += 1
+        counts["bytes"] += len(data)
+
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic source tree")
+    parser.add_argument("output", type=Path, help="Directory to create (must not exist)")
+    parser.add_argument("--files", type=int, default=TreeSpec.files)
+    parser.add_argument("--depth", type=int, default=TreeSpec.depth)
+    parser.add_argument("--fanout", type=int, default=TreeSpec.fanout)
+    parser.add_argument("--median-kb", type=float, default=TreeSpec.median_kb)
+    parser.add_argument("--max-kb", type=float, default=TreeSpec.max_kb)
+    parser.add_argument("--binary-ratio", type=float, default=TreeSpec.binary_ratio)
+    parser.add_argument("--disguised-ratio", type=float, default=TreeSpec.disguised_ratio)
+    parser.add_argument("--pdfs", type=int, default=TreeSpec.pdfs)
+    parser.add_argument("--seed", type=int, default=TreeSpec.seed)
+    args = parser.parse_args()
+
+    if args.output.exists():
+        print(f"ERROR: {args.output} already exists")
+        return 1
+    spec = TreeSpec(
+        files=args.files,
+        depth=args.depth,
+        fanout=args.fanout,
+        median_kb=args.median_kb,
+        max_kb=args.max_kb,
+        binary_ratio=args.binary_ratio,
+        disguised_ratio=args.disguised_ratio,
+        pdfs=args.pdfs,
+        seed=args.seed,
+    )
+    args.output.mkdir(parents=True)
+    counts = generate_tree(args.output, spec)
+    print(json.dumps(counts))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
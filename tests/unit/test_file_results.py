@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+iter_file_results(): results read ahead on the thread pool must not leak
+their open sources when the merge stops early (--budget-policy stop).
+
+Run with: python -m pytest tests/unit
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+import folder2text_core  # noqa: E402
+
+
+class ReadAheadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for number in range(12):
+            path = Path(self.directory.name) / f"file{number}.txt"
+            path.write_text("text\n", encoding="utf-8")
+            self.files.append(path)
+        self.sources = []
+
+    def tearDown(self):
+        for source in self.sources:
+            source.close()
+        self.directory.cleanup()
+
+    def worker(self, path):
+        source = open(path, "rb")
+        self.sources.append(source)
+        return folder2text_core.FileResult(path, path.name, encoding="utf-8", source=source)
+
+    def test_closing_early_closes_read_ahead_sources(self):
+        results = folder2text_core.iter_file_results(self.files, self.worker, workers=3)
+        first = next(results)
+        first.source.close()  # The consumer's own result, as _merge_files() does
+        results.close()
+        self.assertGreater(len(self.sources), 1)
+        self.assertTrue(all(source.closed for source in self.sources))
+
+    def test_results_keep_input_order(self):
+        results = folder2text_core.iter_file_results(self.files, self.worker, workers=3)
+        self.assertEqual([result.path for result in results], self.files)
+
+
+if __name__ == "__main__":
+    unittest.main()
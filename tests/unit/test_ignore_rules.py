@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+gitignore-style rules (.gitignore/.ignore, --exclude, --include):
+_translate_ignore_glob() and compile_ignore_pattern() case by case, and
+the IgnoreMatcher built on them.
+
+Run with: python -m pytest tests/unit
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+import folder2text_core  # noqa: E402
+from folder2text_core import FileEvents, IgnoreMatcher, IgnoreRuleSet  # noqa: E402
+
+BASE = os.path.join(os.sep, "base")
+
+# (pattern, path relative to the ignore file, is_directory, verdict):
+# True = ignored, False = re-included by a '!' rule, None = no match
+PATTERN_CASES = [
+    # No slash: any depth
+    ("*.log", "a.log", False, True),
+    ("*.log", "deep/dir/a.log", False, True),
+    ("*.log", "a.logx", False, None),
+    ("build", "src/build", True, True),
+    # A leading or middle slash anchors to the ignore file's directory
+    ("/build", "build", True, True),
+    ("/build", "src/build", True, None),
+    ("doc/frotz", "doc/frotz", True, True),
+    ("doc/frotz", "a/doc/frotz", True, None),
+    # Directory-only
+    ("build/", "build", True, True),
+    ("build/", "src/build", True, True),
+    ("build/", "build", False, None),
+    # **
+    ("**/foo", "foo", False, True),
+    ("**/foo", "a/b/foo", False, True),
+    ("abc/**", "abc/x/y", False, True),
+    ("abc/**", "abc", True, None),
+    ("a/**/b", "a/b", False, True),
+    ("a/**/b", "a/x/y/b", False, True),
+    ("a/*/b", "a/x/y/b", False, None),
+    ("a**b", "a/b", False, None),
+    # * ? and classes stay inside one component
+    ("*.py", "a/b.py", False, True),
+    ("src/*.py", "src/a/b.py", False, None),
+    ("?.txt", "a.txt", False, True),
+    ("?.txt", "ab.txt", False, None),
+    ("[abc].py", "b.py", False, True),
+    ("[!abc].py", "b.py", False, None),
+    ("[!abc].py", "d.py", False, True),
+    ("[a-c]x", "bx", False, True),
+    # Negation and escapes
+    ("!keep.log", "keep.log", False, False),
+    ("\\!important", "!important", False, True),
+    ("\\#hash", "#hash", False, True),
+    ("name.txt   ", "name.txt", False, True),
+    ("foo\\ ", "foo ", False, True),
+    ("a\\*b", "a*b", False, True),
+    ("a\\*b", "axb", False, None),
+]
+
+
+def native(relative: str) -> str:
+    return os.path.join(BASE, *relative.split("/"))
+
+
+class CompileIgnorePatternTest(unittest.TestCase):
+    def test_patterns(self):
+        for pattern, relative, is_directory, verdict in PATTERN_CASES:
+            with self.subTest(pattern=pattern, path=relative, is_directory=is_directory):
+                rule_set = IgnoreRuleSet.from_lines(BASE, [pattern])
+                self.assertEqual(rule_set.match(native(relative), is_directory), verdict)
+
+    def test_rule_fields(self):
+        rule = folder2text_core.compile_ignore_pattern("!logs/\n")
+        self.assertTrue(rule.negated)
+        self.assertTrue(rule.directory_only)
+        self.assertEqual(rule.regex.pattern, "(?:.*/)?logs")  # A trailing slash does not anchor
+        self.assertEqual(folder2text_core.compile_ignore_pattern("/logs").regex.pattern, "logs")
+
+    def test_blank_lines_and_comments(self):
+        for line in ("", "   ", "# comment", "\n", "/", "!"):
+            with self.subTest(line=line):
+                self.assertIsNone(folder2text_core.compile_ignore_pattern(line))
+
+    def test_translated_globs(self):
+        translate = folder2text_core._translate_ignore_glob
+        self.assertEqual(translate("*.py"), "[^/]*\\.py")
+        self.assertEqual(translate("**/x"), "(?:.*/)?x")
+        self.assertEqual(translate("x/**"), "x/.*")
+        self.assertEqual(translate("[!a]"), "[^a]")
+        self.assertEqual(translate("[unclosed"), "\\[unclosed")
+
+    def test_last_matching_rule_wins(self):
+        rule_set = IgnoreRuleSet.from_lines(BASE, ["*.log", "!keep.log"])
+        self.assertIs(rule_set.match(native("keep.log"), False), False)
+        self.assertIs(rule_set.match(native("other.log"), False), True)
+        rule_set = IgnoreRuleSet.from_lines(BASE, ["!keep.log", "*.log"])
+        self.assertIs(rule_set.match(native("keep.log"), False), True)
+
+
+class IgnoreMatcherTest(unittest.TestCase):
+    def included(self, include, relative):
+        return IgnoreMatcher.for_root(BASE, include=include, read_ignore_files=False).is_included(native(relative))
+
+    def test_include_directory(self):
+        self.assertTrue(self.included(["sub/"], "sub/a.py"))
+        self.assertTrue(self.included(["sub/"], "sub/deep/a.py"))
+        self.assertTrue(self.included(["sub/"], "x/sub/a.py"))
+        self.assertFalse(self.included(["sub/"], "other/a.py"))
+        self.assertFalse(self.included(["/sub/"], "x/sub/a.py"))
+        self.assertTrue(self.included(["docs"], "docs/a.md"))
+
+    def test_include_files(self):
+        self.assertTrue(self.included(["*.py"], "x/a.py"))
+        self.assertFalse(self.included(["*.py"], "a.md"))
+        self.assertTrue(self.included([], "a.md"))
+
+    def test_include_negated_subdirectory(self):
+        include = ["docs/", "!docs/private/"]
+        self.assertTrue(self.included(include, "docs/a.md"))
+        self.assertFalse(self.included(include, "docs/private/a.md"))
+
+    def test_repository_ignore_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            repository = Path(directory)
+            (repository / ".git").mkdir()
+            (repository / ".gitignore").write_text("*.log\n", encoding="utf-8")
+            root = repository / "sub"
+            root.mkdir()
+            events = FileEvents()
+            matcher = IgnoreMatcher.for_root(str(root), events=events)
+            self.assertTrue(matcher.is_ignored(str(root / "a.log"), False))
+            self.assertFalse(matcher.is_ignored(str(root / "a.py"), False))
+            # No .ignore file anywhere: nothing to report
+            self.assertEqual(events.counts, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Large files never go through content.rstrip(): they are copied byte for
+byte (utf8_rstrip_length, scan_passthrough_length, scan_mapped_passthrough)
+or decoded chunk by chunk (_stream_decoded_text via copy_text_stream).
+Every path must give what decoding the whole file and calling rstrip()
+gives, wherever the chunk boundaries fall.
+
+Run with: python -m pytest tests/unit
+"""
+
+import io
+import mmap
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+import folder2text_core  # noqa: E402
+from folder2text_core import (  # noqa: E402
+    OutputWriter,
+    copy_text_stream,
+    decode_text_bytes,
+    scan_mapped_passthrough,
+    scan_passthrough_length,
+    sniff_encoding,
+    utf8_rstrip_length,
+)
+
+SAMPLES = {
+    "crlf": b"one\r\ntwo\r\n\r\n",
+    "lone cr": b"a\rb\r",
+    "crlf after non-ascii": "caf\u00e9\r\n\u00fc\r\n".encode("utf-8"),
+    "nbsp": "text\u00a0\u00a0".encode("utf-8"),
+    "ideographic space": "\u65e5\u672c\u3000\n\u3000".encode("utf-8"),
+    "nel": "end\u0085\n\u0085".encode("utf-8"),
+    "inner whitespace kept": "a\u3000b \u00a0\nc".encode("utf-8"),
+    "only whitespace": "\u3000 \n\u00a0".encode("utf-8"),
+    "multibyte at every edge": ("\u20ac\U0001d11e\u6f22\u3000" * 5 + " \n").encode("utf-8"),
+    "non-ascii last character": "a \u00e9".encode("utf-8"),
+    "truncated utf-8 at the end": "abc\u6f22".encode("utf-8")[:-1],
+    "late cp1252 fallback": b"plain ascii text\n" * 3 + b"caf\xe9\xa0 \r\n",
+    "late cp1252 ellipsis": b"abc\n" * 4 + b"x\x85",  # cp1252 0x85 is not whitespace
+    "empty": b"",
+}
+
+# STREAM_CHUNK_SIZE values; from 4 bytes, the longest UTF-8 sequence
+CHUNK_SIZES = list(range(4, 12)) + [64]
+
+
+def expected_text(data: bytes, encoding: str) -> tuple[str, str]:
+    """What the in-memory path merges: the whole file decoded, then rstrip()."""
+    text, used = decode_text_bytes(data, encoding)
+    return text.rstrip(), used
+
+
+def passthrough_text(data: bytes):
+    """Expected passthrough result: None unless data is UTF-8 without CR."""
+    if b"\r" in data:
+        return None
+    try:
+        return data.decode("utf-8").rstrip()
+    except UnicodeDecodeError:
+        return None
+
+
+class PassthroughTest(unittest.TestCase):
+    def test_utf8_rstrip_length(self):
+        for name, data in SAMPLES.items():
+            expected = passthrough_text(data)
+            if expected is None:
+                continue
+            with self.subTest(sample=name):
+                self.assertEqual(data[:utf8_rstrip_length(data)].decode("utf-8"), expected)
+
+    def test_scan_passthrough_length(self):
+        for name, data in SAMPLES.items():
+            expected = passthrough_text(data)
+            for chunk_size in CHUNK_SIZES:
+                with self.subTest(sample=name, chunk_size=chunk_size):
+                    with mock.patch.object(folder2text_core, "STREAM_CHUNK_SIZE", chunk_size):
+                        scanned = scan_passthrough_length(io.BytesIO(data))
+                    if expected is None:
+                        self.assertIsNone(scanned)
+                    else:
+                        self.assertEqual(data[:scanned[0]].decode("utf-8"), expected)
+                        self.assertEqual(scanned[1], "ascii" if data.isascii() else "utf-8")
+
+    def test_scan_mapped_passthrough(self):
+        for name, data in SAMPLES.items():
+            if not data:
+                continue  # An empty file cannot be mapped
+            expected = passthrough_text(data)
+            with tempfile.TemporaryFile() as file:
+                file.write(data)
+                file.flush()
+                with mmap.mmap(file.fileno(), len(data), access=mmap.ACCESS_READ) as mapping:
+                    for chunk_size in CHUNK_SIZES:
+                        with self.subTest(sample=name, chunk_size=chunk_size):
+                            with mock.patch.object(folder2text_core, "STREAM_CHUNK_SIZE", chunk_size):
+                                scanned = scan_mapped_passthrough(mapping, len(data))
+                            if expected is None:
+                                self.assertIsNone(scanned)
+                            else:
+                                self.assertEqual(data[:scanned[0]].decode("utf-8"), expected)
+
+    def test_stream_decoded_text(self):
+        for name, data in SAMPLES.items():
+            # Large files are sniffed on a prefix: a late invalid byte is found while streaming
+            encoding = sniff_encoding(data[:8])
+            expected, expected_encoding = expected_text(data, encoding)
+            for chunk_size in [1, 2, 3] + CHUNK_SIZES:
+                with self.subTest(sample=name, chunk_size=chunk_size):
+                    buffer = io.BytesIO()
+                    with mock.patch.object(folder2text_core, "STREAM_CHUNK_SIZE", chunk_size):
+                        used = copy_text_stream(io.BytesIO(data), encoding, OutputWriter(buffer))
+                    self.assertEqual(buffer.getvalue().decode("utf-8"), expected)
+                    self.assertEqual(used, expected_encoding)
+
+
+if __name__ == "__main__":
+    unittest.main()
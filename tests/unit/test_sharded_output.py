@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+--shard-size: sections that start a new part must keep their own size in
+the statistics (the part rollover used to be counted inside the section).
+
+Run with: python -m pytest tests/unit
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+import Folder2Text  # noqa: E402
+import folder2text_core  # noqa: E402
+
+
+class ShardedStatisticsTest(unittest.TestCase):
+    FILES = 6
+    FILE_BYTES = 2400
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.tree = self.root / "tree"
+        self.tree.mkdir()
+        self.expected = {}
+        for number in range(self.FILES):
+            name = f"file{number}.txt"
+            content = (f"line {number} " * 40 + "\n") * (self.FILE_BYTES // 480)
+            (self.tree / name).write_text(content, encoding="utf-8", newline="\n")
+            self.expected[name] = len(folder2text_core.section_header(name)) + len(content.rstrip()) + 1
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_sections_that_start_a_part_keep_their_size(self):
+        stats_path = self.root / "stats.json"
+        args = Folder2Text.parse_arguments([
+            str(self.tree),
+            "-o", str(self.root / "out.txt"),
+            "--shard-size", "6k",
+            "--no-cache",
+            "--stats-json", str(stats_path),
+        ])
+        self.assertEqual(folder2text_core.run_export(args, notify=False), folder2text_core.EXIT_OK)
+
+        stats = json.loads(stats_path.read_text(encoding="utf-8"))
+        self.assertGreater(len(stats["output_parts"]), 1)
+        sizes = {entry["path"]: entry["bytes"] for entry in stats["largest_files"]}
+        self.assertEqual(sizes, self.expected)
+        self.assertEqual(stats["output_bytes_by_extension"], {".txt": sum(self.expected.values())})
+
+
+if __name__ == "__main__":
+    unittest.main()